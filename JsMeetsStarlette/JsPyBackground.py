@@ -1,9 +1,9 @@
 # coding: utf-8
 import asyncio
-import queue
 import typing
+from collections import deque
 
-__all__ = ['register_function']
+__all__ = ['register_function', 'register_send']
 
 """Execute function call in background
 
@@ -14,16 +14,38 @@ Attributes
 ----------
 register_function(func: typing.Callable, param) -> None
     Function call reservation
+register_send(func: typing.Callable) -> None
+    Data transmission reservation
 """
 
 # function call reservation
-# Stack data is a tuple of two elements.
+# Stack data is a tuple of three elements.
 # The first element is a function, the second element is
-# parameter of function.
-_func_queue = queue.Queue()
+# parameter of function, the third element is the kind of
+# reservation (_SYNC, _ASYNC or _SEND).
+# asyncio.Queue instance created in startup_handler(), because
+# it must be bound to the running event loop.
+_func_queue = None
+# Event loop of the main thread, captured in startup_handler().
+_main_loop = None
+# Reservations made before startup_handler() is called.
+# append() and popleft() of deque are thread-safe without lock.
+_pending_reserve = deque()
 
 _startup_task = None
 
+# Maximum number of reservations executed per wakeup.
+_BATCH_MAX = 64
+
+# Kind of reservation
+# _SYNC:  normal function
+# _ASYNC: async function
+# _SEND:  async function reserved by register_send().
+#         Consecutive ones are executed together.
+_SYNC = 0
+_ASYNC = 1
+_SEND = 2
+
 def register_function(func: typing.Callable,
                       param: typing.Union[list, tuple, set]) -> None:
     """Function call reservation
@@ -48,34 +70,99 @@ def register_function(func: typing.Callable,
 
     JsPyBackground.register_function(some_func, [1, 2, 3])
     """
-    global _func_queue
-    _func_queue.put_nowait((func, param))
+    _reserve((func, param,
+              _ASYNC if asyncio.iscoroutinefunction(func) else _SYNC))
+
+def register_send(func: typing.Callable[[], typing.Awaitable]) -> None:
+    """Data transmission reservation
+
+    Same as register_function(), but the transmissions reserved one after
+    another are coalesced and executed together with asyncio.gather().
+    The order with the other reservations is kept.
+    The return value and exception of the function is ignored.
+
+    Parameters
+    ----------
+    func: typing.Callable
+        Async function without argument.
+        Use functools.partial() to bind the arguments.
+    """
+    _reserve((func, (), _SEND))
+
+def _reserve(reserve: tuple) -> None:
+    """Pass the reservation to the event loop of the main thread"""
+    loop = _main_loop
+    if loop is None:
+        _pending_reserve.append(reserve)
+        loop = _main_loop
+        if loop is not None:
+            # startup_handler() may have drained before the append.
+            loop.call_soon_threadsafe(_drain_pending)
+    else:
+        # Reservations may be made from other threads.
+        loop.call_soon_threadsafe(_func_queue.put_nowait, reserve)
 
 async def startup_handler() -> None:
     """Start a background process in event loop thread"""
-    global _startup_task
+    global _startup_task, _func_queue, _main_loop
+    _func_queue = asyncio.Queue()
+    # Publish the loop before draining, so that a reservation made
+    # in between is not left behind in _pending_reserve.
+    _main_loop = asyncio.get_running_loop()
+    _drain_pending()
     _startup_task = asyncio.create_task(_event_loop())
 
+def _drain_pending() -> None:
+    """Move the reservations made before startup to the queue"""
+    while _pending_reserve:
+        _func_queue.put_nowait(_pending_reserve.popleft())
+
 async def shutdown_handler() -> None:
     """Shutdown processing when the server is shutdown"""
-    global _startup_task
+    global _startup_task, _func_queue, _main_loop
+    _main_loop = None
     if _startup_task:
         _startup_task.cancel()
+        # Wait for the background process to finish.
+        # It may be cancelled before it starts, and then
+        # CancelledError is not caught in _event_loop().
+        await asyncio.gather(_startup_task, return_exceptions=True)
         _startup_task = None
+    _func_queue = None
 
 async def _event_loop() -> None:
-    """Background process in event loop thread"""
-    global _func_queue
-    while True:
-        if not _func_queue.empty():
-            reserve = _func_queue.get_nowait()
-            try:
-                if asyncio.iscoroutinefunction(reserve[0]):
-                    await reserve[0](*reserve[1])
-                else:
-                    reserve[0](*reserve[1])
-            except asyncio.CancelledError:
-                break
-            except:
-                pass
-        await asyncio.sleep(0)
+    """Background process in event loop thread
+
+    The only cancellation point is waiting for the reservation
+    or an async function of the batch.
+    """
+    func_queue = _func_queue
+    try:
+        while True:
+            # Sleep until a reservation arrives.
+            # Then drain the reservations that have accumulated so far.
+            batch = [await func_queue.get()]
+            while len(batch) < _BATCH_MAX and not func_queue.empty():
+                batch.append(func_queue.get_nowait())
+            # Executed in reservation order. An async function is
+            # awaited at its own position before the next one starts.
+            # Consecutive transmissions are awaited together.
+            sends = []
+            for func, param, kind in batch:
+                try:
+                    if kind == _SEND:
+                        sends.append(func())
+                        continue
+                    if sends:
+                        await asyncio.gather(*sends, return_exceptions=True)
+                        sends = []
+                    if kind == _ASYNC:
+                        await func(*param)
+                    else:
+                        func(*param)
+                except Exception:
+                    pass
+            if sends:
+                await asyncio.gather(*sends, return_exceptions=True)
+    except asyncio.CancelledError:
+        return
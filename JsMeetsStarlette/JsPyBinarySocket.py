@@ -3,11 +3,19 @@ import typing
 import json
 import asyncio
 import queue
+import functools
+from collections import deque
+from contextlib import suppress
 from starlette import status
 from starlette.endpoints import WebSocketEndpoint
-from starlette.websockets import WebSocket
+from starlette.websockets import WebSocket, WebSocketDisconnect
 from . import JsPyBackground
 
+def _ignore_result(future: asyncio.Future) -> None:
+    """Retrieve the exception of future to suppress the warning log"""
+    if not future.cancelled():
+        future.exception()
+
 class JsPyBinarySocket():
     """Websocket endpoint class that works in the background
 
@@ -89,7 +97,17 @@ class JsPyBinarySocket():
     }
     """
     # encoding = 'bytes'
+    __slots__ = ('_url_path', '_connected', '_connection_limit',
+                 '_socket_serial', '_wrapped', '_id_freelist',
+                 '_sockets', '_socket_ids', '_id_to_idx',
+                 '_sync_events', '_async_events',
+                 '_message_handler', '_message_handler_is_coro',
+                 '_message_handler_blocking',
+                 '_msg_queue', '_msg_workers')
     SERIAL_MAX = 0XFFFFFFFF
+    MESSAGE_WORKERS = 8              # Number of message handler workers
+    MESSAGE_QUEUE_MAX = 1024         # Maximum number of pending messages
+    SEND_BATCH = 256                 # Sends started per loop turn (reservecast)
 
     def __init__(self, url_path: str='/jsmeetspy/binarysocket') -> None:
         """Initialize
@@ -107,19 +125,39 @@ class JsPyBinarySocket():
         self._connected = 0              # Number of connected sockets
         self._connection_limit = 0       # Socket connection limit
         self._socket_serial = 0          # ID management assigned to sockets
-
-        # key:   socket ID currently connected
-        # value: starlette.websockets.WebSocket instance
-        self._socket_pool = {}
+        self._wrapped = False            # Socket ID exceeded SERIAL_MAX once
+        # Socket IDs released after self._wrapped became True.
+        self._id_freelist = deque()
+
+        # Currently connected sockets are stored in contiguous lists.
+        # WebSocket instances and the socket IDs at the same index.
+        self._sockets = []
+        self._socket_ids = []
+        # key:   socket ID currently connected (in connection order)
+        # value: index of self._sockets and self._socket_ids
+        self._id_to_idx = {}
 
         # Callback functions called at websocket connect and disconnect.
         # Normal function or async function.
         # Function has two argument.
         # The first argument is the socket ID where the event occurred.
         # The second argument is the event name 'connect' or 'disconnect'.
-        self._socket_events = set()
+        # Normal functions and async functions are stored separately.
+        # Immutable snapshots, replaced as a whole when registering,
+        # so that iteration while calling never sees a mutation.
+        self._sync_events = ()
+        self._async_events = ()
 
         self._message_handler = lambda a,b,c: None
+        self._message_handler_is_coro = False
+        self._message_handler_blocking = False
+
+        # Received messages waiting for the async message handler.
+        # Tuple of (WebSocket, socket ID, bytes data).
+        # asyncio.Queue instance created in startup_handler().
+        self._msg_queue = None
+        # Worker tasks that call the async message handler.
+        self._msg_workers = []
 
     # --------------------
     # The following four method are required for extended websockets.
@@ -127,9 +165,20 @@ class JsPyBinarySocket():
         """Returns the websocket URL pathname"""
         return self._url_path
 
-    # Not implemented
-    # async def startup_handler(self) -> None
-    # async def shutdown_handler(self) -> None
+    async def startup_handler(self) -> None:
+        """Start the message handler workers at server startup"""
+        self._msg_queue = asyncio.Queue(maxsize=self.MESSAGE_QUEUE_MAX)
+        self._msg_workers = [asyncio.create_task(self._message_worker())
+                             for i in range(self.MESSAGE_WORKERS)]
+
+    async def shutdown_handler(self) -> None:
+        """Stop the message handler workers when the server is shutdown"""
+        workers, self._msg_workers = self._msg_workers, []
+        self._msg_queue = None
+        for worker in workers:
+            worker.cancel()
+        # Wait for the workers to finish.
+        await asyncio.gather(*workers, return_exceptions=True)
 
     def endpoint(self):
         """Return websocket endpoint"""
@@ -173,7 +222,7 @@ class JsPyBinarySocket():
             (socket ID1, socket ID2, ...)
             An empty tuple if there are no connected socket.
         """
-        return tuple(self._socket_pool.keys())
+        return tuple(self._id_to_idx.keys())
 
     def close_socket(self, socket_id: int) -> bool:
         """Disconnects the websocket with the specified socket ID.
@@ -195,9 +244,9 @@ class JsPyBinarySocket():
             If False, the socket ID specified in the argument
             is not currently connected.
         """
-        if socket_id in self._socket_pool:
+        if socket_id in self._id_to_idx:
             JsPyBackground.register_function(
-                self._socket_pool[socket_id].close, [])
+                self._sockets[self._id_to_idx[socket_id]].close, [])
             return(True)
         else:
             return(False)
@@ -219,7 +268,11 @@ class JsPyBinarySocket():
         ----------
         clear_socket_event()
         """
-        self._socket_events.add(func)
+        if asyncio.iscoroutinefunction(func):
+            if func not in self._async_events:
+                self._async_events = self._async_events + (func,)
+        elif func not in self._sync_events:
+            self._sync_events = self._sync_events + (func,)
 
     def clear_socket_event(self) -> None:
         """Clear all callback functions called by websocket event.
@@ -228,9 +281,11 @@ class JsPyBinarySocket():
         ----------
         add_socket_event()
         """
-        self._socket_events.clear()
+        self._sync_events = ()
+        self._async_events = ()
 
-    def set_message_handler(self, callback: typing.Callable) -> None:
+    def set_message_handler(self, callback: typing.Callable,
+                            blocking: bool=False) -> None:
         """Register a callback function called when data arrives from client.
 
         Register a callback function when a websocket is received.
@@ -249,8 +304,18 @@ class JsPyBinarySocket():
             The second argument is the source socket ID.
 
             The third argument is bytes data.
+        blocking: bool, default False
+            Valid only when callback is a normal function.
+            True:
+                The callback function is executed in a worker thread of
+                the default executor, so that a blocking callback does not
+                stop the event loop.
+            False:
+                The callback function is executed in the event loop.
         """
         self._message_handler = callback
+        self._message_handler_is_coro = asyncio.iscoroutinefunction(callback)
+        self._message_handler_blocking = blocking
 
     def reservecast(self, data: bytes, socket: typing.Union[
                     None, int, typing.List[int],
@@ -259,11 +324,16 @@ class JsPyBinarySocket():
 
         This can be used on other than the main thread.
         Reserved for data transmission and processed later.
-        Execution result and exception cannot be caught.
+        Execution result and exception of the transmission cannot be caught.
+
+        The data and the destination socket IDs are determined
+        at the time of this call.
+        Sockets disconnected before the transmission are skipped.
 
         Parameters
         ----------
-        data: bytes
+        data: bytes or bytearray or memoryview
+            bytearray and memoryview are copied to bytes in this call.
         socket: None or int or list or tuple or set, default None
             socket ID to send. If None, same as broadcast()
             The socket ID is a unique number that is assigned to the socket
@@ -271,8 +341,25 @@ class JsPyBinarySocket():
             Multiple sockets may be connected from one client.
 
             It is different from the socket ID of sister library JsPyTextSocket.
+
+        Raises
+        ----------
+        TypeError
+            data is not bytes, bytearray or memoryview.
         """
-        JsPyBackground.register_function(self.multicast, (data, socket))
+        if not isinstance(data, bytes):
+            if not isinstance(data, (bytearray, memoryview)):
+                raise TypeError('data must be bytes, bytearray or memoryview')
+            data = bytes(data)
+        # Only the socket IDs are taken here. They are resolved to
+        # WebSocket instances in the event loop thread, because the
+        # socket lists are rearranged there on disconnection.
+        if socket is None:
+            socket = tuple(self._socket_ids)
+        elif isinstance(socket, (list, set)):
+            socket = tuple(socket)
+        JsPyBackground.register_send(functools.partial(
+            self._reserved_send, data, socket))
 
     def broadcast(self, data: bytes) -> typing.Awaitable:
         """Send bytes data to the currently connected sockets.
@@ -287,16 +374,15 @@ class JsPyBinarySocket():
 
         Parameters
         ----------
-        data: bytes
+        data: bytes or bytearray or memoryview
+            Converted to bytes only once for all sockets.
 
         Returns
         ----------
         asyncio.gather instance with return_exceptions=True
         """
-        cor_list = []
-        for socket_id in self._socket_pool:
-            cor_list.append(self._socket_pool[socket_id].send_bytes(data))
-        return asyncio.gather(*cor_list, return_exceptions=True)
+        return asyncio.gather(*self._send_coroutines(data, None),
+                              return_exceptions=True)
 
     def multicast(self, data: bytes, socket: typing.Union[
                   None, int, typing.List[int],
@@ -313,7 +399,8 @@ class JsPyBinarySocket():
 
         Parameters
         ----------
-        data: bytes
+        data: bytes or bytearray or memoryview
+            Converted to bytes only once for all sockets.
         socket: None or int or list or tuple or set, default None
             socket ID to send. If None, same as broadcast()
             The socket ID is a unique number that is assigned to the socket
@@ -326,17 +413,56 @@ class JsPyBinarySocket():
         ----------
         asyncio.gather instance with return_exceptions=True
         """
-        cor_list = []
+        return asyncio.gather(*self._send_coroutines(data, socket),
+                              return_exceptions=True)
+
+    def _target_sockets(self, socket: typing.Union[
+                        None, int, typing.List[int],
+                        typing.Tuple[int], typing.Set[int]]) -> list:
+        """List of WebSocket instances of the specified socket IDs"""
         if socket is None:
-            return self.broadcast(data)
+            return list(self._sockets)
         elif isinstance(socket, int):
-            if socket in self._socket_pool:
-                cor_list.append(self._socket_pool[socket].send_bytes(data))
+            if socket in self._id_to_idx:
+                return [self._sockets[self._id_to_idx[socket]]]
         elif isinstance(socket, (tuple, list, set)):
-            for i in socket:
-                if i in self._socket_pool:
-                    cor_list.append(self._socket_pool[i].send_bytes(data))
-        return asyncio.gather(*cor_list, return_exceptions=True)
+            return [self._sockets[self._id_to_idx[i]]
+                    for i in socket if i in self._id_to_idx]
+        return []
+
+    def _send_coroutines(self, data: bytes, socket: typing.Union[
+                         None, int, typing.List[int],
+                         typing.Tuple[int], typing.Set[int]]) -> list:
+        """List of send_bytes() coroutines to the specified sockets"""
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        if socket is None:
+            return [ws.send_bytes(data) for ws in self._sockets]
+        return [ws.send_bytes(data) for ws in self._target_sockets(socket)]
+
+    async def _reserved_send(self, data: bytes, socket: typing.Union[
+                             int, typing.Tuple[int]]) -> None:
+        """Send reserved by reservecast()
+
+        Nobody receives the result, so asyncio.wait() is used instead of
+        asyncio.gather() to skip collecting the results.
+
+        The sends are started SEND_BATCH at a time, yielding to the event
+        loop in between, so that a broadcast to many sockets does not
+        hold the event loop.
+        """
+        sockets = self._target_sockets(socket)
+        batch = self.SEND_BATCH
+        tasks = []
+        for start in range(0, len(sockets), batch):
+            if start:
+                await asyncio.sleep(0)
+            tasks.extend(asyncio.ensure_future(ws.send_bytes(data))
+                         for ws in sockets[start:start + batch])
+        if tasks:
+            await asyncio.wait(tasks)
+            for task in tasks:
+                _ignore_result(task)
 
     def _append_socket(self, ws: WebSocket) -> int:
         """websocket registration
@@ -354,15 +480,32 @@ class JsPyBinarySocket():
             The assigned socket ID. Unique number assigned from 1.
             Increment by 1 in connection order.
         """
+        if not self._wrapped:
+            self._socket_serial += 1
+            if self._socket_serial <= JsPyBinarySocket.SERIAL_MAX:
+                return(self._register_socket(self._socket_serial, ws))
+            self._wrapped = True
+            self._socket_serial = 0
+        # After the wraparound, reuse the released socket ID first.
+        while self._id_freelist:
+            socket_id = self._id_freelist.popleft()
+            if socket_id not in self._id_to_idx:
+                return(self._register_socket(socket_id, ws))
         self._socket_serial += 1
         if self._socket_serial > JsPyBinarySocket.SERIAL_MAX:
             self._socket_serial = 1
-        while self._socket_serial in self._socket_pool:
+        while self._socket_serial in self._id_to_idx:
             self._socket_serial += 1
             if self._socket_serial > JsPyBinarySocket.SERIAL_MAX:
                 self._socket_serial = 1
-        self._socket_pool[self._socket_serial] = ws
-        return(self._socket_serial)
+        return(self._register_socket(self._socket_serial, ws))
+
+    def _register_socket(self, socket_id: int, ws: WebSocket) -> int:
+        """Append websocket to the end of the socket list"""
+        self._id_to_idx[socket_id] = len(self._sockets)
+        self._sockets.append(ws)
+        self._socket_ids.append(socket_id)
+        return(socket_id)
 
     def _delete_socket(self, socket_id: int) -> None:
         """websocket unregistration
@@ -378,8 +521,42 @@ class JsPyBinarySocket():
 
             It is different from the socket ID of sister library JsPyTextSocket.
         """
-        if socket_id in self._socket_pool:
-            del self._socket_pool[socket_id]
+        if socket_id in self._id_to_idx:
+            # Move the last socket to the deleted position.
+            idx = self._id_to_idx.pop(socket_id)
+            last_ws = self._sockets.pop()
+            last_id = self._socket_ids.pop()
+            if last_id != socket_id:
+                self._sockets[idx] = last_ws
+                self._socket_ids[idx] = last_id
+                self._id_to_idx[last_id] = idx
+            if self._wrapped:
+                self._id_freelist.append(socket_id)
+
+    def _call_socket_events(self, socket_id: int, event: str) -> None:
+        """Call the callback functions registered by add_socket_event()
+
+        Async functions are executed later in the event loop.
+        """
+        for callback in self._sync_events:
+            with suppress(Exception):
+                callback(socket_id, event)
+        for callback in self._async_events:
+            with suppress(Exception):
+                asyncio.create_task(callback(socket_id, event))
+
+    async def _message_worker(self) -> None:
+        """Call the message handler for the queued messages"""
+        msg_queue = self._msg_queue
+        while True:
+            ws, socket_id, data = await msg_queue.get()
+            try:
+                if self._message_handler_is_coro:
+                    await self._message_handler(ws, socket_id, data)
+                else:
+                    self._message_handler(ws, socket_id, data)
+            except Exception:
+                pass
 
     async def socket_handler(self, ws: WebSocket):
         """Processing when websocket is newly established
@@ -390,48 +567,59 @@ class JsPyBinarySocket():
         self._connected += 1
         await ws.accept()
         _socket_id = self._append_socket(ws)
-        if self._connection_limit > 0 and\
-           self._connected > self._connection_limit:
-            await ws.close()
-        else:
-            for callback in self._socket_events:
-                try:
-                    if asyncio.iscoroutinefunction(callback):
-                        asyncio.create_task(callback(_socket_id, 'connect'))
-                    else:
-                        callback(_socket_id, 'connect')
-                except:
-                    pass
-            try:
-                while True:
-                    message = await ws.receive()
-                    if message["type"] == "websocket.receive":
-                        if 'bytes' not in message:
-                            await ws.close(code=status.WS_1003_UNSUPPORTED_DATA)
-                            break
-                        data = message['bytes']
-                        try:
-                            if not self._message_handler:
-                                pass
-                            elif(asyncio.iscoroutinefunction(self._message_handler)):
-                                asyncio.create_task(
-                                    self._message_handler(ws, _socket_id, data))
-                            else:
-                                self._message_handler(ws, _socket_id, data)
-                        except:
-                            pass
-                    elif message["type"] == "websocket.disconnect":
+        try:
+            if self._connection_limit > 0 and\
+               self._connected > self._connection_limit:
+                await ws.close()
+            else:
+                self._call_socket_events(_socket_id, 'connect')
+                await self._receive_loop(ws, _socket_id)
+        finally:
+            # Also executed when the task is cancelled.
+            self._delete_socket(_socket_id)
+            self._connected -= 1
+            self._call_socket_events(_socket_id, 'disconnect')
+
+    async def _receive_loop(self, ws: WebSocket, socket_id: int) -> None:
+        """Receive data until the websocket is disconnected"""
+        # Invariant lookups are bound to locals before the loop.
+        # The message handler is read for each message, because
+        # set_message_handler() may be called during the connection.
+        run_in_executor = asyncio.get_running_loop().run_in_executor
+        create_task = asyncio.create_task
+        receive = ws.receive
+        unsupported = status.WS_1003_UNSUPPORTED_DATA
+        try:
+            while True:
+                message = await receive()
+                msg_type = message.get("type")
+                if msg_type == "websocket.receive":
+                    data = message.get("bytes")
+                    if data is None:
+                        await ws.close(code=unsupported)
                         break
-            except:
-                pass
-        self._delete_socket(_socket_id)
-        self._connected -= 1
-        for callback in self._socket_events:
-            try:
-                if asyncio.iscoroutinefunction(callback):
-                    asyncio.create_task(
-                        callback(_socket_id, 'disconnect'))
-                else:
-                    callback(_socket_id, 'disconnect')
-            except:
-                pass
+                    handler = self._message_handler
+                    is_coro = self._message_handler_is_coro
+                    msg_queue = self._msg_queue
+                    if not handler:
+                        pass
+                    elif not is_coro:
+                        if self._message_handler_blocking:
+                            run_in_executor(
+                                None, handler, ws, socket_id, data
+                            ).add_done_callback(_ignore_result)
+                        else:
+                            with suppress(Exception):
+                                handler(ws, socket_id, data)
+                    elif msg_queue is None or msg_queue.full():
+                        # No workers, or the workers are busy.
+                        # Never stall the receive loop on them.
+                        with suppress(Exception):
+                            create_task(handler(ws, socket_id, data))
+                    else:
+                        msg_queue.put_nowait((ws, socket_id, data))
+                elif msg_type == "websocket.disconnect":
+                    break
+        except (WebSocketDisconnect, RuntimeError, OSError):
+            # Receive or close failed because the websocket was broken.
+            pass
@@ -1,27 +1,120 @@
 # coding: utf-8
 import typing
 import asyncio
-import json
-import queue
+import itertools
+import operator
+from collections import deque
 from starlette.websockets import WebSocket
-from .JsPyTextSocket import JsPyTextSocket, JsPyError
+from .JsPyTextSocket import JsPyTextSocket, JsPyError, _encode
 
-__all__ = ['expose', 'callable', 'exclusive_callable', 'clear',
-           'is_running', 'get_keys', 'has', 'call_nowait', 'call']
+__all__ = ['expose', 'expose_many', 'callable', 'exclusive_callable',
+           'clear', 'is_running', 'get_keys', 'has', 'call_nowait', 'call']
+
+class _ExposedFunction:
+    """Record of python function exposed to clients
+
+    Attributes
+    ----------
+    func: Callable
+        Python function called from javascript.
+    iscoroutine: bool
+        Whether func is an async function.
+    running: bool
+        Whether func is running now.
+    exclusive: collections.deque or None
+        Waiting list of exclusive execution. None if not exclusive.
+    dispatch: Callable
+        Async function that calls func with a list of arguments.
+        Returns a tuple (return value, exception message or None).
+        Chosen once here according to iscoroutine and exclusive.
+    return_prefix: str
+        Encoded head of 'function_return' up to the value of 'id'.
+    """
+    __slots__ = ('func', 'iscoroutine', 'running', 'exclusive',
+                 'dispatch', 'return_prefix', '_run')
+
+    def __init__(self, key: str, func: typing.Callable,
+                 exclusive: bool) -> None:
+        self.func = func
+        self.iscoroutine = asyncio.iscoroutinefunction(func)
+        self.running = False
+        self.exclusive = deque() if exclusive else None
+        self._run = self._run_async if self.iscoroutine else self._run_sync
+        self.dispatch = self._run_exclusive if exclusive else self._run
+        self.return_prefix = ('{"protocol":"function_return","key":' +
+                              _encode(key) + ',"id":')
+
+    async def _run_sync(self, args: list) -> tuple:
+        """Call normal function"""
+        self.running = True
+        try:
+            return self.func(*args), None
+        except Exception as e:
+            return None, str(e) + ' @python'
+        finally:
+            self.running = False
+
+    async def _run_async(self, args: list) -> tuple:
+        """Call async function"""
+        self.running = True
+        try:
+            return (await self.func(*args)), None
+        except Exception as e:
+            return None, str(e) + ' @python'
+        finally:
+            self.running = False
+
+    async def _run_exclusive(self, args: list) -> tuple:
+        """Call function exclusively, first-come, first-served"""
+        if self.running:
+            # Make a reservation in the waiting list and wait in order.
+            this_future = asyncio.get_running_loop().create_future()
+            self.exclusive.append(this_future)
+            await this_future
+        try:
+            return await self._run(args)
+        finally:
+            if self.exclusive:
+                self.exclusive.popleft().set_result(True)
+                self.running = True    # soon running
+
+class _CallWaiter:
+    """Collects the responses of one call() from the clients
+
+    Attributes
+    ----------
+    pending: set
+        Socket ID of the clients that have not responded yet.
+    values: dict
+        key:   Socket ID that responded.
+        value: Return value from client. Or JsPyError instance.
+    done: asyncio.Future
+        Completed when all clients have responded.
+    """
+    __slots__ = ('pending', 'values', 'done')
+
+    def __init__(self, target_sockets, done: asyncio.Future) -> None:
+        self.pending = set(target_sockets)
+        self.values = {}
+        self.done = done
 
 # Function definition called from javascript.
 # key:
 #   The key name associated with the python function.
 # value:
-#   [Callable, iscoroutine: bool, is_running: bool, queue.Queue or None]
+#   _ExposedFunction instance
 _exposed_function = {}
 # Id number assigned to protocol 'function_call' and 'function'.
-_call_id = 0
+# this_id = _call_count() % _CALL_ID_MAX + 1  -> 1, 2, ..., _CALL_ID_MAX, 1, ...
+_call_count = itertools.count().__next__
 _CALL_ID_MAX = 0XFFFFFFFF
-# Future instance waiting for function_return from clients.
+# Waiting for function_return from clients.
 # key: call_id
-# value: list of future instance
+# value: _CallWaiter instance
 _call_memory = {}
+# Take out the five keys of the received data at once.
+# JsPyTextSocket guarantees that all keys exist.
+_unpack = operator.itemgetter('protocol', 'key', 'id', 'data', 'exception')
 
 def expose(key: str, func: typing.Callable, exclusive: bool=False) -> bool:
     """Expose python function to clients by specified key name.
@@ -65,6 +158,7 @@ def expose(key: str, func: typing.Callable, exclusive: bool=False) -> bool:
         Specifiable types:
                 int, float, str, True, False, None(convert to null)
                 list, dict, tuple(convert to list)
+                float nan, inf(convert to null only if orjson is installed)
     exclusive: bool, default False
         Whether to run exclusively.
         True:
@@ -88,16 +182,37 @@ def expose(key: str, func: typing.Callable, exclusive: bool=False) -> bool:
     callable, exclusive_callable
         Another way by decorator.
     """
-    global _exposed_function
-
-    if (key in _exposed_function) and _exposed_function[key][2]:
+    if (key in _exposed_function) and _exposed_function[key].running:
         return False
-    _exposed_function[key] = [func,
-                              asyncio.iscoroutinefunction(func),
-                              False,
-                              queue.Queue() if exclusive else None]
+    _exposed_function[key] = _ExposedFunction(key, func, exclusive)
     return True
 
+def expose_many(functions: typing.Iterable[typing.Tuple[
+                str, typing.Callable, bool]]) -> typing.List[bool]:
+    """Expose many python functions to clients at once.
+
+    Same as calling expose() for each item.
+
+    Examples in server side
+    ----------
+    JsPyFunction.expose_many([('abc', xyz, False), ('def', uvw, True)])
+
+    Parameters
+    ----------
+    functions: Iterable of (key, func, exclusive)
+        Parameters of expose(). exclusive can be omitted. (key, func)
+
+    Returns
+    ----------
+    list of bool
+        Result of expose() for each item in the same order.
+
+    See Also
+    ----------
+    expose
+    """
+    return [expose(*item) for item in functions]
+
 def callable(func: typing.Callable) -> typing.Callable:
     """Decorator that exposes Python functions to clients.
 
@@ -131,13 +246,8 @@ def callable(func: typing.Callable) -> typing.Callable:
     expose()
         Another way by function.
     """
-    global _exposed_function
-
     if func.__name__ not in _exposed_function:
-        _exposed_function[func.__name__] = [func,
-                                            asyncio.iscoroutinefunction(func),
-                                            False,
-                                            None]
+        _exposed_function[func.__name__] = _ExposedFunction(func.__name__, func, False)
         return func
     else:
         raise KeyError('The exposed function "{}" is invalid @python'.format(
@@ -176,13 +286,8 @@ def exclusive_callable(func: typing.Callable) -> typing.Callable:
     expose()
         Another way by function.
    """
-    global _exposed_function
-
     if func.__name__ not in _exposed_function:
-        _exposed_function[func.__name__] = [func,
-                                            asyncio.iscoroutinefunction(func),
-                                            False,
-                                            queue.Queue()]
+        _exposed_function[func.__name__] = _ExposedFunction(func.__name__, func, True)
         return func
     else:
         raise KeyError('The exposed function "{}" is invalid @python'.format(
@@ -203,8 +308,7 @@ def clear(key: str) -> bool:
         Successful(True) or unsuccessful(False).
         Fails if exposed key name is present but running now.
     """
-    global _exposed_function
-    if (key in _exposed_function) and (not _exposed_function[key][2]):
+    if (key in _exposed_function) and (not _exposed_function[key].running):
         del _exposed_function[key]
         return True
     else:
@@ -227,10 +331,8 @@ def is_running(key: str) -> bool:
     bool
         Now running in the background(True) or not(False).
     """
-    global _exposed_function
-
     if key in _exposed_function:
-        return _exposed_function[key][2]
+        return _exposed_function[key].running
     else:
         return False
 
@@ -242,8 +344,6 @@ def get_keys() -> typing.List[str]:
     list[str]
         Key name list.
     """
-    global _exposed_function
-
     return list(_exposed_function.keys())
 
 def has(key: str) -> bool:
@@ -260,8 +360,6 @@ def has(key: str) -> bool:
     bool
         The key name exists(True) or not(False).
     """
-    global _exposed_function
-
     return(key in _exposed_function)
 
 def call_nowait(key: str,
@@ -328,18 +426,18 @@ def call_nowait(key: str,
             Specifiable types:
                 int, float, str, None, True, False,
                 list, dict, tuple(convert to list)
+                float nan, inf(convert to null only if orjson is installed)
     """
-    def inner_nowait(*args) -> None:
-        global _call_id, _CALL_ID_MAX
-        nonlocal key, target
+    # Fixed part of the data to send. Only 'id' and 'data' change per call.
+    template = {'protocol': 'function', 'key': key,
+                'id': 0, 'data': None, 'exception': None}
 
-        _call_id += 1
-        if _call_id > _CALL_ID_MAX:
-            _call_id = 1
-        this_id = _call_id
+    def inner_nowait(*args) -> None:
+        this_id = _call_count() % _CALL_ID_MAX + 1
 
-        send_dic = {'protocol': 'function', 'key': key,
-                    'id': this_id, 'data': args, 'exception': None}
+        send_dic = template.copy()
+        send_dic['id'] = this_id
+        send_dic['data'] = args
         JsPyTextSocket.reservecast(send_dic, target)
     return inner_nowait
 
@@ -419,6 +517,7 @@ def call(key: str,
             Specifiable types:
                 int, float, str, None, True, False,
                 list, dict, tuple(convert to list)
+                float nan, inf(convert to null only if orjson is installed)
 
         Callable Returns
         ----------
@@ -438,126 +537,102 @@ def call(key: str,
     Get only the values returned within the time limit.
     Return values after the time limit are ignored.
     """
+    # Fixed part of the data to send. Only 'id' and 'data' change per call.
+    template = {'protocol': 'function_call', 'key': key,
+                'id': 0, 'data': None, 'exception': None}
+
+    # How to find the target sockets. Chosen once by the type of target.
+    if target is None:
+        def resolve() -> typing.Sequence[int]:
+            return JsPyTextSocket.get_socket_id()
+    elif isinstance(target, int):
+        def resolve() -> typing.Sequence[int]:
+            if target in JsPyTextSocket.get_socket_id_set():
+                return [target]
+            return []
+    elif isinstance(target, (tuple, list, set)):
+        target_set = frozenset(target)
+        def resolve() -> typing.Sequence[int]:
+            return list(JsPyTextSocket.get_socket_id_set() & target_set)
+    else:
+        def resolve() -> typing.Sequence[int]:
+            return []
+    # Wait indefinitely if 0 or negative or None.
+    if (timeout is not None) and (timeout <= 0):
+        timeout = None
+
     async def inner(*args) -> dict:
-        global _call_id, _call_memory, _CALL_ID_MAX
-        nonlocal key, timeout, target
-
-        _call_id += 1
-        if _call_id > _CALL_ID_MAX:
-            _call_id = 1
-        this_id = _call_id
-
-        target_sockets = []
-        if target is None:
-            target_sockets = JsPyTextSocket.get_socket_id()
-        elif isinstance(target, int):
-            all_sockets = JsPyTextSocket.get_socket_id()
-            if target in all_sockets:
-                target_sockets = [target]
-        elif isinstance(target, (tuple, list, set)):
-            all_sockets = JsPyTextSocket.get_socket_id()
-            target_sockets = [i for i in target if (i in all_sockets)]
+        this_id = _call_count() % _CALL_ID_MAX + 1
 
+        target_sockets = resolve()
         # There is no specified client.
         if len(target_sockets) == 0:
             return {}
-        send_dic = {'protocol': 'function_call', 'key': key,
-                    'id': this_id, 'data': args, 'exception': None}
-        # Make future in the number of clients
+        send_dic = template.copy()
+        send_dic['id'] = this_id
+        send_dic['data'] = args
+        # Encode once before anything is registered.
+        try:
+            text_data = _encode(send_dic)
+        except Exception as e:
+            raise TypeError('Parameter is not JSON serializable @python') from e
+        # One future completed by the last response of the clients
         this_loop = asyncio.get_running_loop()
-        this_futures = [this_loop.create_future() for i in target_sockets]
-        _call_memory[this_id] = this_futures
-        # Send a function call to clients
-        JsPyTextSocket.multicast(send_dic, target_sockets)
-        # Waiting for a response from clients with timeout
-        if (timeout is not None) and (timeout <= 0):
-            timeout = None
-        done, pending = await asyncio.wait(this_futures, timeout=timeout)
-        return_value = {}
-        for ft in done:
+        waiter = _CallWaiter(target_sockets, this_loop.create_future())
+        _call_memory[this_id] = waiter
+        try:
+            # Send a function call to clients
+            JsPyTextSocket.multicast_text(text_data, target_sockets)
+            # Waiting for a response from clients with timeout
             try:
-                value = ft.result()
-                return_value[value[0]] = value[1]
-            except JsPyError as e:
-                return_value[e.get_socket_id()] = e
-        del _call_memory[this_id]
-        return return_value
+                await asyncio.wait_for(waiter.done, timeout)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            del _call_memory[this_id]
+        return waiter.values
     return inner
 
 def _return_from_js(ws: WebSocket, socket_id: int, dict_data: dict) -> None:
     """Processes data with protocol 'function_return'"""
-    global _call_memory
-
-    protocol = dict_data.get('protocol')
-    key = dict_data.get('key')
-    id = dict_data.get('id')
-    data = dict_data.get('data')
-    excpt = dict_data.get('exception')
-    if isinstance(id, int) and (id in _call_memory):
-        for ft in _call_memory[id]:
-            if ft.done():
-                continue
+    protocol, key, id, data, excpt = _unpack(dict_data)
+    waiter = _call_memory.get(id) if isinstance(id, int) else None
+    if waiter is not None:
+        pending = waiter.pending
+        if socket_id in pending:
+            pending.remove(socket_id)
+            if excpt is not None:
+                waiter.values[socket_id] = JsPyError(excpt, protocol, key,
+                                                     id, socket_id)
             else:
-                if excpt is not None:
-                    ft.set_exception(JsPyError(excpt, protocol, key, id, socket_id))
-                else:
-                    ft.set_result((socket_id, data))
-                break
+                waiter.values[socket_id] = data
+            if not waiter.pending and not waiter.done.done():
+                waiter.done.set_result(True)
     # else: ignore
 
 async def _call_from_js(ws: WebSocket, socket_id: int, dict_data: dict) -> None:
     """Processes data with protocol 'function_call' or 'function'"""
-    global _exposed_function
-
-    protocol = dict_data.get('protocol')
-    key = dict_data.get('key')
-    id = dict_data.get('id')
-    send_dic = {'protocol': 'function_return', 'key': key, 'id': id,
-                'data': None, 'exception': None}
-    if (not isinstance(key, str)) or (key not in _exposed_function):
-        send_dic['data'] = None
-        send_dic['exception'] = 'Function key name is not registered @python'
+    protocol, key, id, data, _ = _unpack(dict_data)
+    record = _exposed_function.get(key) if isinstance(key, str) else None
+    if record is None:
+        data = None
+        excpt = 'Function key name is not registered @python'
     else:
-        func = _exposed_function[key][0]
-        iscoroutine = _exposed_function[key][1]
-        isrunning = _exposed_function[key][2]
-        exclusive = _exposed_function[key][3]
-        if exclusive and isrunning:
-            this_loop = asyncio.get_running_loop()
-            this_future = this_loop.create_future()
-            exclusive.put_nowait(this_future)
-            # Since it is an exclusive execution function,
-            # it makes a reservation in the waiting list and waits in order.
-            await this_future
-
-        _exposed_function[key][2] = True    # function running
-        # Start of function call
-        await asyncio.sleep(0)
-        if iscoroutine:
-            try:
-                send_dic['data'] = await func(*dict_data.get('data'))
-            except Exception as e:
-                send_dic['data'] = None
-                send_dic['exception'] = str(e) + ' @python'
-        else:
+        data, excpt = await record.dispatch(data)
+    if protocol == 'function_call':
+        send_text = None
+        if excpt is None:
+            # Only 'id' and 'data' are encoded. The rest is fixed.
             try:
-                send_dic['data'] = func(*dict_data.get('data'))
+                send_text = (record.return_prefix + _encode(id) +
+                             ',"data":' + _encode(data) +
+                             ',"exception":null}')
             except Exception as e:
-                send_dic['data'] = None
-                send_dic['exception'] = str(e) + ' @python'
-        await asyncio.sleep(0)
-        # End of function call
-        _exposed_function[key][2] = False   # function not running
-        if exclusive and (not exclusive.empty()):
-            exclusive.get_nowait().set_result(True)
-            _exposed_function[key][2] = True    # soon running
-    if protocol == 'function_call':
-        try:
-            send_text = json.dumps(send_dic)
-        except Exception as e:
-            send_dic['exception'] = str(e) + ' @python'
-            send_dic['data'] = None
-            send_text = json.dumps(send_dic)
+                data = None
+                excpt = str(e) + ' @python'
+        if send_text is None:
+            send_text = _encode({'protocol': 'function_return', 'key': key,
+                                 'id': id, 'data': data, 'exception': excpt})
         await ws.send_text(send_text)
     # elif protocol == 'function':  Not return to client
 
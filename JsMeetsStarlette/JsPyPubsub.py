@@ -1,20 +1,25 @@
 # coding: utf-8
 import typing
-import json
 import asyncio
+import itertools
 from starlette.websockets import WebSocket
-from .JsPyTextSocket import JsPyTextSocket, JsPyError
+from .JsPyTextSocket import JsPyTextSocket, JsPyError, _encode
 from . import JsPyBackground
 
 __all__ = ['subscribe', 'unsubscribe', 'publish']
 
 # Id number assigned to 'pub'.
-_pubsub_id = 0
+# this_id = _pubsub_count() % _PUBSUB_ID_MAX + 1  -> 1, 2, ..., 1, ...
+_pubsub_count = itertools.count().__next__
 _PUBSUB_ID_MAX = 0xFFFFFFFF
 # Management ledger of subscribed client IDs for topics.
 # key:   name of topic
 # value: Set of subscribed socket ID
 _topic_manager = {}
+# Reverse index of _topic_manager.
+# key:   subscribed socket ID
+# value: Set of topic name
+_socket_topics = {}
 # Server callback function ledger for topic.
 # key:   name of topic
 # value: Callback function
@@ -66,10 +71,8 @@ def subscribe(topic: str, func: typing.Callable=None):
     ----------
     True
     """
-    global _topic_callback
     if func is None:
         def inner(target_func: typing.Callable) -> None:
-            global _topic_callback
             nonlocal topic
             _topic_callback[topic] = target_func
         return inner
@@ -89,7 +92,6 @@ def unsubscribe(topic: str):
     ----------
     True
     """
-    global _topic_callback
     if topic in _topic_callback:
         del _topic_callback[topic]
     return True
@@ -143,19 +145,28 @@ def publish(topic: str, suppress: bool=False) -> typing.Callable:
             Specifiable types:
                 int, float, str, None, True, False,
                 list, dict, tuple(convert to list)
+                float nan, inf(convert to null only if orjson is installed)
 
         Callable returns
         ----------
         True
+
+        Callable Raises
+        ----------
+        TypeError
+            Message is not JSON serializable.
+            Nothing is published in that case.
     """
     def inner(message) -> bool:
-        global _topic_manager, _topic_callback, _pubsub_id, _PUBSUB_ID_MAX
         nonlocal topic, suppress
-        _pubsub_id += 1
-        if _pubsub_id > _PUBSUB_ID_MAX:
-            _pubsub_id = 1
-        send_dic = {'protocol': 'pub', 'key': topic, 'id': _pubsub_id,
+        this_id = _pubsub_count() % _PUBSUB_ID_MAX + 1
+        send_dic = {'protocol': 'pub', 'key': topic, 'id': this_id,
                     'data': message, 'exception': None}
+        # Encode once for all subscribers, before anything is distributed.
+        try:
+            text_data = _encode(send_dic)
+        except Exception as e:
+            raise TypeError('Message is not JSON serializable @python') from e
         # from broker to server side subscriber
         if (suppress is False) and (topic in _topic_callback):
             JsPyBackground.register_function(
@@ -163,7 +174,9 @@ def publish(topic: str, suppress: bool=False) -> typing.Callable:
         # from broker to client side subscriber
         if topic in _topic_manager:
             # Data transmission is not guaranteed.
-            JsPyTextSocket.reservecast(send_dic, _topic_manager[topic])
+            JsPyBackground.register_function(
+                JsPyTextSocket.multicast_text,
+                (text_data, _topic_manager[topic]))
         return(True)
     return inner
 
@@ -174,13 +187,15 @@ def get_topics() -> typing.List[str]:
     ----------
     typing.List[str]
     """
-    global _topic_callback
     return list(_topic_callback.keys())
 
 
 def _sub_from_js(ws: WebSocket, socket_id: int, dict_data: dict) -> None:
-    """Processes data with protocol 'sub_call'"""
-    global _topic_manager
+    """Processes data with protocol 'sub_call'
+
+    A normal function, so that the ledgers are updated before the
+    disconnection of the socket is processed. Only the reply is sent later.
+    """
     topic = dict_data.get('key')
     send_dic = {'protocol': 'sub_return', 'key': topic, 'id': dict_data['id'],
                 'data': None, 'exception': None}
@@ -188,14 +203,14 @@ def _sub_from_js(ws: WebSocket, socket_id: int, dict_data: dict) -> None:
         if topic in _topic_manager:
             _topic_manager[topic].add(socket_id)
         else:
-            _topic_manager[topic] = set([socket_id])
+            _topic_manager[topic] = {socket_id}
+        _socket_topics.setdefault(socket_id, set()).add(topic)
     except:
         send_dic['exception'] = 'The topic name is incorrect @python'
-    asyncio.create_task(ws.send_json(send_dic))
+    asyncio.create_task(ws.send_text(_encode(send_dic)))
 
 def _unsub_from_js(ws: WebSocket, socket_id: int, dict_data: dict) -> None:
     """Processes data with protocol 'unsub_call'"""
-    global _topic_manager
     topic = dict_data.get('key')
     send_dic = {'protocol': 'unsub_return', 'key': topic, 'id': dict_data['id'],
                 'data': None, 'exception': None}
@@ -204,22 +219,20 @@ def _unsub_from_js(ws: WebSocket, socket_id: int, dict_data: dict) -> None:
             _topic_manager[topic].discard(socket_id)
             if not _topic_manager[topic]:
                 del _topic_manager[topic]
+        if socket_id in _socket_topics:
+            _socket_topics[socket_id].discard(topic)
+            if not _socket_topics[socket_id]:
+                del _socket_topics[socket_id]
     except:
         send_dic['exception'] = 'The topic name is incorrect @python'
-    asyncio.create_task(ws.send_json(send_dic))
+    asyncio.create_task(ws.send_text(_encode(send_dic)))
 
-def _pub_from_js(ws: WebSocket, socket_id: int, dict_data: dict) -> None:
+async def _pub_from_js(ws: WebSocket, socket_id: int, dict_data: dict) -> None:
     """Processes data with protocol 'pub_call'"""
-    global _topic_manager, _topic_callback, _pubsub_id, _PUBSUB_ID_MAX
     topic = dict_data['key']
     suppress = dict_data['exception']
     message = dict_data['data']
-    send_dic = {'protocol': 'pub_return', 'key': topic,
-                'id': dict_data['id'], 'data': None, 'exception': None}
-    asyncio.create_task(ws.send_json(send_dic))
-    _pubsub_id += 1
-    if _pubsub_id > _PUBSUB_ID_MAX:
-        _pubsub_id = 1
+    this_id = _pubsub_count() % _PUBSUB_ID_MAX + 1
     # from broker to server side subscriber
     try:
         if topic in _topic_callback:
@@ -230,17 +243,24 @@ def _pub_from_js(ws: WebSocket, socket_id: int, dict_data: dict) -> None:
     except:
         pass
     # from broker to client side subscriber
-    send_dic = {'protocol': 'pub', 'key': topic, 'id': _pubsub_id,
+    send_dic = {'protocol': 'pub', 'key': topic, 'id': this_id,
                 'data': message, 'exception': None}
     try:
         if topic in _topic_manager:
+            # Encode once for all subscribers.
             if suppress is False:
-                JsPyTextSocket.multicast(send_dic, _topic_manager[topic])
+                JsPyTextSocket.multicast_text(_encode(send_dic),
+                                              _topic_manager[topic])
             else:
-                JsPyTextSocket.multicast(send_dic,
-                    _topic_manager[topic]-{socket_id})
+                JsPyTextSocket.multicast_text(_encode(send_dic),
+                                              _topic_manager[topic]-{socket_id})
     except:
         pass
+    # Acknowledge last, so that a broken publisher socket
+    # does not prevent the delivery to the subscribers.
+    send_dic = {'protocol': 'pub_return', 'key': topic,
+                'id': dict_data['id'], 'data': None, 'exception': None}
+    await ws.send_text(_encode(send_dic))
 
 JsPyTextSocket.add_protocol('sub_call', _sub_from_js)
 JsPyTextSocket.add_protocol('unsub_call', _unsub_from_js)
@@ -249,11 +269,13 @@ JsPyTextSocket.add_protocol('pub_call', _pub_from_js)
 def _socket_event(socket_id: int, event: str):
     """When the web socket is closed, remove the socket ID
     from the topic manager."""
-    global _topic_manager
     if event == 'disconnect':
-        for topic in _topic_manager:
-            _topic_manager[topic].discard(socket_id)
-            if not _topic_manager[topic]:
-                del _topic_manager[topic]
+        # Only the topics subscribed by this socket are visited.
+        for topic in _socket_topics.pop(socket_id, ()):
+            subscribers = _topic_manager.get(topic)
+            if subscribers is not None:
+                subscribers.discard(socket_id)
+                if not subscribers:
+                    del _topic_manager[topic]
 
 JsPyTextSocket.add_socket_event(_socket_event)
@@ -1,31 +1,62 @@
 # coding: utf-8
 import typing
-import json
 import asyncio
+import itertools
+import operator
 from collections import deque
 from starlette.websockets import WebSocket
-from .JsPyTextSocket import JsPyTextSocket, JsPyError
+from .JsPyTextSocket import JsPyTextSocket, JsPyError, _encode, _binary_frame
 from . import JsPyBackground
 
 __all__ = ['push_nowait', 'push', 'pop', 'shift', 'add_callback',
-           'clear_callback', 'is_empty', 'get_keys',
-           'has', 'clear', 'clear_all', 'remove', 'remove_all']
+           'remove_callback', 'clear_callback', 'is_empty', 'get_keys',
+           'has', 'clear', 'clear_all', 'remove', 'remove_all', 'set_batch',
+           'set_maxlen']
+
+class _PushWaiter:
+    """Collects the acknowledgments of one push() from the clients
+
+    Attributes
+    ----------
+    pending: set
+        Socket ID of the clients that have not responded yet.
+    received: list
+        Socket ID of the clients that received the data.
+    done: asyncio.Future
+        Completed when all clients have responded.
+    """
+    __slots__ = ('pending', 'received', 'done')
+
+    def __init__(self, target_sockets, done: asyncio.Future) -> None:
+        self.pending = set(target_sockets)
+        self.received = []
+        self.done = done
 
 # Queue data pool
 # key:   name of queue
 # value: queue data (collections.deque object)
 _queue_stack = {}
+# Upper limit of the number of data in the server queue.
+# key:   name of queue
+# value: maximum length (Refer to set_maxlen())
+_queue_maxlen = {}
 # Id number assigned to protocol 'queue' and 'queue_call'
-_queue_id = 0
+# this_id = _queue_count() % _QUEUE_ID_MAX + 1  -> 1, 2, ..., 1, ...
+_queue_count = itertools.count().__next__
 _QUEUE_ID_MAX = 0XFFFFFFFF
-# Future instance waiting for queue_return from clients.
+# Waiting for queue_return from clients.
 # key:   queue_id
-# value: list of future instance
+# value: _PushWaiter instance
 _queue_memory = {}
 # Callback function called every time Queue data arrives from client.
 # Normal function or async function.
 # Function has one argument. It is the key name of the queue that arrived.
-_queue_callbacks = set()
+# Split by kind at registration. Replaced (not mutated) on every change.
+_coro_callbacks = ()
+_sync_callbacks = ()
+# Take out the five keys of the received data at once.
+# JsPyTextSocket guarantees that all keys exist.
+_unpack = operator.itemgetter('protocol', 'key', 'id', 'data', 'exception')
 
 def push_nowait(key: str,
                 target: typing.Union[int,
@@ -96,24 +127,57 @@ def push_nowait(key: str,
             Specifiable types:
                     int, float, str, True, False, None(convert to null)
                     list, dict, tuple(convert to list)
+                    float nan, inf(convert to null only if orjson is installed)
+                    bytes, bytearray, memoryview(sent in a binary frame,
+                        ArrayBuffer on the client side)
+
+        Callable Raises
+        ----------
+        TypeError
+            Parameter is not JSON serializable.
     """
+    # Encoded head of the message up to the value of 'id'.
+    prefix = '{"protocol":"queue","key":' + _encode(key) + ',"id":'
+
     def inner_nowait(data) -> None:
-        global _queue_id, _QUEUE_ID_MAX
-        nonlocal key, target
-
-        _queue_id += 1
-        if _queue_id > _QUEUE_ID_MAX:
-            _queue_id = 1
-        this_id = _queue_id
-        if this_id > _QUEUE_ID_MAX:
-            this_id = 1
-
-        send_dic = {'protocol': 'queue', 'key': key,
-                    'id': this_id, 'data': data, 'exception': None}
+        this_id = _queue_count() % _QUEUE_ID_MAX + 1
+
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            # Binary data is sent as it is, without JSON encoding.
+            byte_data = _binary_frame({'protocol': 'queue', 'key': key,
+                                       'id': this_id, 'exception': None},
+                                      data)
+            JsPyBackground.register_function(
+                _send_binary, (byte_data, target))
+            return
+        # Only 'id' and 'data' are encoded. The rest is fixed.
+        text_data = (prefix + str(this_id) + ',"data":' + _encode(data) +
+                     ',"exception":null}')
         # Send a queue call to clients
-        JsPyTextSocket.reservecast(send_dic, target)
+        JsPyTextSocket.reservecast_text(text_data, target)
     return inner_nowait
 
+def set_batch(enable: bool) -> None:
+    """Enable or disable batch transmission of push_nowait().
+
+    Same as JsPyTextSocket.set_coalesce(enable).
+    When enabled, the data pushed by push_nowait() in the same turn of
+    the event loop is sent to each client together in one websocket
+    frame (a JSON array of messages). The order of the data is kept.
+    The setting is shared with JsPyTextSocket, so the other data reserved
+    by JsPyTextSocket.reservecast() is also coalesced.
+
+    Parameters
+    ----------
+    enable: bool
+        True: Batch transmission. False(default): One frame per push.
+
+    See Also
+    ----------
+    JsPyTextSocket.set_coalesce()
+    """
+    JsPyTextSocket.set_coalesce(enable)
+
 def push(key: str,
          timeout: typing.Union[int, float, None]=0,
          target: typing.Union[int,
@@ -174,6 +238,9 @@ def push(key: str,
             Specifiable types:
                     int, float, str, True, False, None(convert to null)
                     list, dict, tuple(convert to list)
+                    float nan, inf(convert to null only if orjson is installed)
+                    bytes, bytearray, memoryview(sent in a binary frame,
+                        ArrayBuffer on the client side)
 
         Callable Returns
         ----------
@@ -187,50 +254,64 @@ def push(key: str,
         TypeError
             Parameter is not JSON serializable.
     """
-    async def inner(data) -> list:
-        global _queue_id, _QUEUE_ID_MAX, _queue_memory
-        nonlocal key, timeout, target
-
-        _queue_id += 1
-        if _queue_id > _QUEUE_ID_MAX:
-            _queue_id = 1
-        this_id = _queue_id
-
-        target_sockets = []
-        if target is None:
-            target_sockets = JsPyTextSocket.get_socket_id()
-        elif isinstance(target, int):
-            all_sockets = JsPyTextSocket.get_socket_id()
-            if target in all_sockets:
-                target_sockets = [target]
-        elif isinstance(target, (tuple, list, set)):
-            all_sockets = JsPyTextSocket.get_socket_id()
-            target_sockets = [i for i in target if (i in all_sockets)]
+    # Encoded head of the message up to the value of 'id'.
+    prefix = '{"protocol":"queue_call","key":' + _encode(key) + ',"id":'
+
+    # How to find the target sockets. Chosen once by the type of target.
+    if target is None:
+        resolve = JsPyTextSocket.get_socket_id
+    elif isinstance(target, int):
+        def resolve() -> typing.Sequence[int]:
+            if target in JsPyTextSocket.get_socket_id_set():
+                return [target]
+            return []
+    elif isinstance(target, (tuple, list, set)):
+        target_set = frozenset(target)
+        def resolve() -> typing.Sequence[int]:
+            return list(JsPyTextSocket.get_socket_id_set() & target_set)
+    else:
+        def resolve() -> typing.Sequence[int]:
+            return []
+    # Wait indefinitely if 0 or negative or None.
+    if (timeout is not None) and (timeout <= 0):
+        timeout = None
 
+    async def inner(data) -> list:
+        target_sockets = resolve()
         # There is no specified client.
-        if len(target_sockets) == 0:
+        if not target_sockets:
             return []
-        send_dic = {'protocol': 'queue_call', 'key': key,
-                    'id': this_id, 'data': data, 'exception': None}
 
-        # Make future in the number of clients
+        this_id = _queue_count() % _QUEUE_ID_MAX + 1
+        # Skip the id still waiting for a response after a wraparound.
+        while this_id in _queue_memory:
+            this_id = _queue_count() % _QUEUE_ID_MAX + 1
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            # Binary data is sent as it is, without JSON encoding.
+            send = JsPyTextSocket.multicast_bytes
+            send_data = _binary_frame({'protocol': 'queue_call', 'key': key,
+                                       'id': this_id, 'exception': None},
+                                      data)
+        else:
+            # Only 'id' and 'data' are encoded. The rest is fixed.
+            send = JsPyTextSocket.multicast_text
+            send_data = (prefix + str(this_id) + ',"data":' + _encode(data) +
+                         ',"exception":null}')
+
+        # One future completed by the last response of the clients
         this_loop = asyncio.get_running_loop()
-        this_futures = [this_loop.create_future() for i in target_sockets]
-        _queue_memory[this_id] = this_futures
-        # Send a queue call to clients
-        JsPyTextSocket.multicast(send_dic, target_sockets)
+        waiter = _PushWaiter(target_sockets, this_loop.create_future())
+        _queue_memory[this_id] = waiter
         # Waiting for a response from clients with timeout
-        if (timeout is not None) and (timeout <= 0):
-            timeout = None
-        done, pending = await asyncio.wait(this_futures, timeout=timeout)
-        return_value = []
-        for ft in done:
-            try:
-                return_value.append(ft.result())
-            except:
-                pass
-        del _queue_memory[this_id]
-        return return_value
+        try:
+            # Send a queue call to clients
+            send(send_data, target_sockets)
+            await asyncio.wait_for(waiter.done, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            del _queue_memory[this_id]
+        return waiter.received
     return inner
 
 def pop(key: str, default_value=None):
@@ -255,13 +336,8 @@ def pop(key: str, default_value=None):
     ----------
     shift()
     """
-    global _queue_stack
-    if key in _queue_stack:
-        return(_queue_stack[key].pop()
-               if len(_queue_stack[key])
-               else default_value)
-    else:
-        return default_value
+    stack = _queue_stack.get(key)
+    return stack.pop() if stack else default_value
 
 def shift(key: str, default_value=None):
     """Remove and return an element from the left side of the queue.(FIFO)
@@ -285,13 +361,31 @@ def shift(key: str, default_value=None):
     ----------
     pop()
     """
-    global _queue_stack
-    if key in _queue_stack:
-        return(_queue_stack[key].popleft()
-               if len(_queue_stack[key])
-               else default_value)
+    stack = _queue_stack.get(key)
+    return stack.popleft() if stack else default_value
+
+def set_maxlen(key: str, maxlen: typing.Optional[int]=None) -> None:
+    """Limit the number of data in the server queue with the key name.
+
+    When data arrives in a full queue, the oldest data (left side)
+    is discarded. The limit also applies to a queue created later
+    with the key name.
+
+    Parameters
+    ----------
+    key: str
+        The name that identifies the server side queue.
+        It has an independent queue for each key name.
+    maxlen: int or None, default None
+        Maximum number of data. None means unlimited.
+        If the queue already has more data, the oldest data is discarded.
+    """
+    if maxlen is None:
+        _queue_maxlen.pop(key, None)
     else:
-        return default_value
+        _queue_maxlen[key] = maxlen
+    if key in _queue_stack:
+        _queue_stack[key] = deque(_queue_stack[key], maxlen)
 
 def add_callback(func: typing.Callable) -> None:
     """Register the callback function when data arrives in the server queue.
@@ -330,20 +424,44 @@ def add_callback(func: typing.Callable) -> None:
 
     See Also
     ----------
-    clear_callback()
+    remove_callback(), clear_callback()
     """
-    global _queue_callbacks
-    _queue_callbacks.add(func)
+    global _coro_callbacks, _sync_callbacks
+    if func in _coro_callbacks or func in _sync_callbacks:
+        return
+    if asyncio.iscoroutinefunction(func):
+        _coro_callbacks = _coro_callbacks + (func,)
+    else:
+        _sync_callbacks = _sync_callbacks + (func,)
+
+def remove_callback(func: typing.Callable) -> None:
+    """Remove the callback function registered by add_callback().
+
+    Nothing is done if the function is not registered.
+
+    Parameters
+    ----------
+    func: Callable
+        Function registered by add_callback().
+
+    See Also
+    ----------
+    add_callback(), clear_callback()
+    """
+    global _coro_callbacks, _sync_callbacks
+    _coro_callbacks = tuple(f for f in _coro_callbacks if f != func)
+    _sync_callbacks = tuple(f for f in _sync_callbacks if f != func)
 
 def clear_callback() -> None:
     """Clear all callback functions when data arrives in the server queue.
 
     See Also
     ----------
-    add_callback()
+    add_callback(), remove_callback()
     """
-    global _queue_callbacks
-    _queue_callbacks.clear()
+    global _coro_callbacks, _sync_callbacks
+    _coro_callbacks = ()
+    _sync_callbacks = ()
 
 def is_empty(key: str) -> bool:
     """Whether data is empty in the queue with the key name.
@@ -359,11 +477,7 @@ def is_empty(key: str) -> bool:
     bool
         True(not exit key name or empty), False(not empty)
     """
-    global _queue_stack
-    if key in _queue_stack:
-        return(len(_queue_stack[key]) == 0)
-    else:
-        return True
+    return not _queue_stack.get(key)
 
 def get_keys() -> typing.List[str]:
     """Get a list of all key names that exist in the server queue.
@@ -372,7 +486,6 @@ def get_keys() -> typing.List[str]:
     ----------
     list
     """
-    global _queue_stack
     return list(_queue_stack.keys())
 
 def has(key: str) -> bool:
@@ -392,7 +505,6 @@ def has(key: str) -> bool:
     bool
         True(exist), False(not exist)
     """
-    global _queue_stack
     return key in _queue_stack
 
 def clear(key: str) -> None:
@@ -411,9 +523,9 @@ def clear(key: str) -> None:
     ----------
     clear_all(), remove(), remove_all()
     """
-    global _queue_stack
-    if key in _queue_stack:
-        _queue_stack[key].clear()
+    stack = _queue_stack.get(key)
+    if stack is not None:
+        stack.clear()
 
 def clear_all() -> None:
     """Clear the inventory data of the all server queue.
@@ -425,9 +537,8 @@ def clear_all() -> None:
     ----------
     clear(), remove(), remove_all()
     """
-    global _queue_stack
-    for key in _queue_stack:
-        _queue_stack[key].clear()
+    for stack in _queue_stack.values():
+        stack.clear()
 
 def remove(key: str) -> None:
     """Delete server queue with the specified key name.
@@ -438,7 +549,6 @@ def remove(key: str) -> None:
     ----------
     clear(), clear_all(), remove_all()
     """
-    global _queue_stack
     if key in _queue_stack:
         del _queue_stack[key]
 
@@ -451,55 +561,55 @@ def remove_all() -> None:
     ----------
     clear(), clear_all(), remove()
     """
-    global _queue_stack
     _queue_stack.clear()
 
+def _send_binary(byte_data: bytes, target) -> None:
+    """Send a binary frame reserved by push_nowait()
+
+    The text data coalesced before it is sent first,
+    so that the order of the data is kept.
+    """
+    JsPyTextSocket.flush_now()
+    JsPyTextSocket.multicast_bytes(byte_data, target)
+
 async def _queue(ws: WebSocket, socket_id: int, dict_data: dict) -> None:
     """Processes data with protocol 'queue', 'queue_call'"""
-    global _queue_stack, _queue_callbacks
-
-    key = dict_data.get('key')
-    data = dict_data.get('data')
-    id = dict_data.get('id')
-    send_dic = {'protocol': 'queue_return', 'key': key, 'id': id,
-                'data': None, 'exception': None}
+    protocol, key, id, data, _ = _unpack(dict_data)
+    excpt = None
     try:
-        if key in _queue_stack:
-            _queue_stack[key].append(data)
+        stack = _queue_stack.get(key)
+        if stack is not None:
+            stack.append(data)
         else:
-            _queue_stack[key] = deque([data])
+            _queue_stack[key] = deque([data], _queue_maxlen.get(key))
     except:
-        send_dic['exception'] = 'The queue key name is incorrect @python'
-        if dict_data.get('protocol') == 'queue_call':
-            await ws.send_json(send_dic)
+        excpt = 'The queue key name is incorrect @python'
     else:
-        for callback in _queue_callbacks:
+        for callback in _coro_callbacks:
             try:
-                if asyncio.iscoroutinefunction(callback):
-                    asyncio.create_task(callback(key))
-                else:
-                    JsPyBackground.register_function(callback, (key,))
+                asyncio.create_task(callback(key))
             except:
                 pass
-        if dict_data.get('protocol') == 'queue_call':
-            await ws.send_json(send_dic)
+        for callback in _sync_callbacks:
+            JsPyBackground.register_function(callback, (key,))
+    # The reply is only made for 'queue_call'.
+    if protocol == 'queue_call':
+        send_dic = {'protocol': 'queue_return', 'key': key,
+                    'id': id, 'data': None, 'exception': excpt}
+        await ws.send_text(_encode(send_dic))
 
 def _queue_return(ws: WebSocket, socket_id: int, dict_data: dict) -> None:
     """Processes data with protocol 'queue_return'"""
-    global _queue_memory
-
-    id = dict_data.get('id')
-    exception = dict_data.get('exception')
-    if isinstance(id, int) and (id in _queue_memory):
-        for ft in _queue_memory[id]:
-            if ft.done():
-                continue
-            else:
-                if not exception:
-                    ft.set_result(socket_id)
-                else:
-                    ft.set_exception(exception)
-                break
+    _, _, id, _, exception = _unpack(dict_data)
+    waiter = _queue_memory.get(id) if isinstance(id, int) else None
+    if waiter is not None:
+        pending = waiter.pending
+        if socket_id in pending:
+            pending.remove(socket_id)
+            if not exception:
+                waiter.received.append(socket_id)
+            if not waiter.pending and not waiter.done.done():
+                waiter.done.set_result(True)
 
 JsPyTextSocket.add_protocol('queue', _queue)
 JsPyTextSocket.add_protocol('queue_call', _queue)
@@ -3,9 +3,92 @@ import typing
 import json
 import asyncio
 import queue
+from asyncio import create_task as _create_task, gather as _gather
 from starlette.endpoints import WebSocketEndpoint
 from starlette.websockets import WebSocket
 from . import JsPyBackground
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def jspy_json_default(obj):
+    """JSON encoding of exception instances
+
+    When JsPyError() instance or Exception() instance is JSON encoded,
+    it is replaced with a character string. Usable as the default
+    parameter of json.dumps(), orjson.dumps() and the like.
+
+    Examples
+    ----------
+    import orjson
+    from JsMeetsStarlette import jspy_json_default
+
+    json_bytes = orjson.dumps(some_obj, default=jspy_json_default)
+
+    Raises
+    ----------
+    TypeError
+        obj is not an exception instance.
+    """
+    if isinstance(obj, JsPyError):
+        return f'<{obj.__class__.__name__}>: {obj.report()}'
+    elif isinstance(obj, Exception):
+        return f'<{obj.__class__.__name__}>: {obj.args}'
+    raise TypeError(
+        f'Object of type {obj.__class__.__name__} is not JSON serializable')
+
+# JSON encoder of the data sent to clients. Returns str.
+# Use orjson if it is installed, otherwise the standard json module
+# with compact separators and no escape of non-ASCII characters.
+# Exception instances are encoded by jspy_json_default().
+# Both give the same result, except for the following.
+#   float nan and inf: null with orjson, NaN and Infinity without.
+#   Types natively supported only by orjson (uuid.UUID, enum.Enum etc.)
+#   are encoded with orjson, and raise TypeError without.
+# Circular or too deeply nested data raises TypeError with both.
+_json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'),
+                                 check_circular=False,
+                                 default=jspy_json_default).encode
+
+def _json_encode(obj) -> str:
+    try:
+        return _json_encoder(obj)
+    except RecursionError:
+        # Without the circular check, circular data ends up here.
+        raise TypeError('Circular reference or too deep nesting') from None
+
+if orjson is not None:
+    # datetime and dataclass raise TypeError as without orjson.
+    _ORJSON_OPTION = (orjson.OPT_NON_STR_KEYS |
+                      orjson.OPT_PASSTHROUGH_DATETIME |
+                      orjson.OPT_PASSTHROUGH_DATACLASS)
+
+    def _encode(obj) -> str:
+        try:
+            return orjson.dumps(obj, default=jspy_json_default,
+                                option=_ORJSON_OPTION).decode()
+        except TypeError:
+            # What orjson refuses, such as int over 64 bits,
+            # is left to the standard json module.
+            return _json_encode(obj)
+else:
+    _encode = _json_encode
+# JSON decoder of the data received from clients. (str or bytes)
+_decode = orjson.loads if orjson is not None else json.loads
+
+def _binary_frame(header: dict, data) -> bytes:
+    """Make a binary frame sent to clients. (Refer to JsPyTextSocket Notes)
+
+    Parameters
+    ----------
+    header: dict
+        The four keys other than "data".
+    data: bytes or bytearray or memoryview
+        Binary data sent as it is without JSON encoding.
+    """
+    header_bytes = _encode(header).encode('utf-8')
+    return len(header_bytes).to_bytes(4, 'big') + header_bytes + bytes(data)
 
 class JsPyError(Exception):
     """Exception class for JsPyTextSocket
@@ -44,7 +127,9 @@ class JsPyError(Exception):
         self._id = id
         self._socket_id = socket_id
         self._msg = msg
-        super().__init__(self.report())
+        self._report = (f'{msg} in {{protocol: {protocol}, key: {key}, '
+                        f'id: {id}, socket_id: {socket_id}}}')
+        super().__init__(self._report)
 
     def __repr__(self):
         return self._msg
@@ -55,8 +140,7 @@ class JsPyError(Exception):
 
     def report(self) -> str:
         """Detailed explanation of the cause of the exception """
-        return(self._msg+' in {protocol: '+self._protocol+', key: '+self._key+
-               ', id: '+str(self._id)+', socket_id: '+str(self._socket_id)+'}')
+        return self._report
 
     def get_socket_id(self) -> int:
         """Get socket ID of the place where the exception occurred
@@ -85,14 +169,13 @@ class JsPyError(Exception):
         from JsMeetsStarlette import JsPyError
 
         json_str = json.dumps(some_obj, cls=JsPyError.JSONEncoder)
+
+        See Also
+        ----------
+        jspy_json_default()
         """
         def default(self, obj):
-            if isinstance(obj, JsPyError):
-                return '<'+obj.__class__.__name__+'>: '+obj.report()
-            elif isinstance(obj, Exception):
-                return '<'+obj.__class__.__name__+'>: '+str(obj.args)
-            else:
-                return json.JSONEncoder.default(self, obj)
+            return jspy_json_default(obj)
 
 class JsPyTextSocket(WebSocketEndpoint):
     """Websocket endpoint class that works in the background
@@ -114,6 +197,8 @@ class JsPyTextSocket(WebSocketEndpoint):
         Get the number of currently connected sockets.
     get_socket_id() -> tuple
         Get a tuple of currently connected socket ID.
+    get_socket_id_set() -> typing.AbstractSet[int]
+        Get a set-like view of currently connected socket ID.
     close_socket(socket_id: int) -> bool
         Disconnects the websocket with the specified socket ID.
 
@@ -129,12 +214,33 @@ class JsPyTextSocket(WebSocketEndpoint):
                 None, int, typing.List[int],
                 typing.Tuple[int], typing.Set[int]]=None) -> None
         Reserve to send data in JSON format to the specified sockets.
+    reservecast_text(text_data: str, socket: typing.Union[
+                     None, int, typing.List[int],
+                     typing.Tuple[int], typing.Set[int]]=None) -> None
+        Reserve to send already JSON encoded text to the specified sockets.
+    reservecast_many(messages: typing.Iterable[typing.Tuple[
+                     typing.Any, typing.Union[
+                     None, int, typing.List[int],
+                     typing.Tuple[int], typing.Set[int]]]]) -> None
+        Reserve to send many data at once. Same as repeated reservecast().
+    set_coalesce(enable: bool) -> None
+        Enable or disable coalescing of reservecast() in one frame.
+    flush_now() -> None
+        Send the coalesced data immediately.
     broadcast(data) -> list
         Send data in JSON format to the currently connected clients.
     multicast(data, socket: typing.Union[
               None, int, typing.List[int],
               typing.Tuple[int], typing.Set[int]]=None) -> list
         Send data in JSON format to the specified sockets.
+    multicast_text(text_data: str, socket: typing.Union[
+                   None, int, typing.List[int],
+                   typing.Tuple[int], typing.Set[int]]=None) -> list
+        Send already JSON encoded text to the specified sockets.
+    multicast_bytes(byte_data: bytes, socket: typing.Union[
+                    None, int, typing.List[int],
+                    typing.Tuple[int], typing.Set[int]]=None) -> list
+        Send a binary frame to the specified sockets.
 
     Notes
     ----------
@@ -157,13 +263,33 @@ class JsPyTextSocket(WebSocketEndpoint):
 
         key:   "exception"
         value: Any (almost None or str)
+
+    Binary data is sent from the server in a binary frame
+    without JSON encoding. (multicast_bytes())
+        4 bytes:   Length of the header. (unsigned big endian)
+        N bytes:   Header. JSON format string in UTF-8 with the four keys
+                   other than "data".
+        The rest:  Value of "data". (ArrayBuffer on the client side)
+
+    A text frame from the server may be a JSON array of the above data,
+    when several data are coalesced in one frame. (set_coalesce())
     """
     encoding = 'text'
     _SOCKET_PATH = '/jsmeetspy/textsocket'
 
     _connected = 0              # Number of connected clients
     _connection_limit = 0       # Client connection limit
-    _protocol_table = {}        # Function corresponding to protocol name
+    # key:   protocol name
+    # value: (processing function, whether it is an async function)
+    _protocol_table = {}
+    # Keys that every received data must have. (Refer to Notes)
+    _REQUIRED_KEYS = frozenset(('protocol', 'key', 'id', 'data', 'exception'))
+    # JSON text sent at connection. (Refer to on_connect())
+    _REFUSED_TEXT = _encode({'protocol': 'system', 'key': 'connect', 'id': 0,
+                             'data': None, 'exception':
+                             'Connection refused due to connection limit @python'})
+    _ACCEPT_PREFIX = '{"protocol":"system","key":"connect","id":0,"data":'
+    _ACCEPT_SUFFIX = ',"exception":null}'
 
     _socket_serial = 0          # ID management assigned to clients
     SERIAL_MAX = 0XFFFFFFFF     # Maximum number of socket ID
@@ -172,12 +298,25 @@ class JsPyTextSocket(WebSocketEndpoint):
     # value: starlette.websockets.WebSocket instance
     _socket_pool = {}
 
+    # Coalescing of reserved transmission. (Refer to set_coalesce())
+    _coalesce = False
+    # Upper limit of the length of one coalesced frame.
+    OUTBOX_TEXT_MAX = 0x10000
+    # Encoded messages waiting for the next flush.
+    # key:   socket ID
+    # value: list of JSON string
+    _outbox = {}
+    _outbox_scheduled = False
+
     # Callback functions called at websocket connect and disconnect.
     # Normal function or async function.
     # Function has two argument.
     # The first argument is the client socket ID where the event occurred.
     # The second argument is the event name 'connect' or 'disconnect'.
-    _socket_events = set()
+    # Split by kind at registration. Immutable snapshots, replaced as
+    # a whole when registering, so that iteration never sees a mutation.
+    _sync_events = ()
+    _async_events = ()
 
     # --------------------
     # The following four classmethod are required for extended websockets.
@@ -235,6 +374,21 @@ class JsPyTextSocket(WebSocketEndpoint):
         """
         return tuple(cls._socket_pool.keys())
 
+    @classmethod
+    def get_socket_id_set(cls) -> typing.AbstractSet[int]:
+        """Get a set-like view of currently connected socket ID.
+
+        Unlike get_socket_id(), nothing is copied. The view reflects
+        later connections and disconnections, so use it immediately.
+        Suitable for membership tests and set operations.
+
+        Returns
+        ----------
+        typing.AbstractSet[int]
+            Read-only view of the socket ID. (dict keys view)
+        """
+        return cls._socket_pool.keys()
+
     @classmethod
     def close_socket(cls, socket_id: int) -> bool:
         """Disconnects the websocket with the specified socket ID.
@@ -253,13 +407,18 @@ class JsPyTextSocket(WebSocketEndpoint):
             If False, the socket ID specified in the argument
             is not currently connected.
         """
-        if socket_id in cls._socket_pool:
-            JsPyBackground.register_function(
-                cls._socket_pool[socket_id].close, [])
-            # on_disconnect() is called immediately by close()
-            return(True)
-        else:
+        ws = cls._socket_pool.get(socket_id)
+        if ws is None:
             return(False)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Called from other threads. Pass to the event loop.
+            JsPyBackground.register_function(ws.close, [])
+        else:
+            _create_task(ws.close())
+        # on_disconnect() is called immediately by close()
+        return(True)
 
     @classmethod
     def add_protocol(cls, protocol: str, func: typing.Callable) -> None:
@@ -286,7 +445,8 @@ class JsPyTextSocket(WebSocketEndpoint):
             The dictionary data has the following five keys.
             (protocol, key, id, data, exception)
         """
-        cls._protocol_table[protocol] = func
+        cls._protocol_table[protocol] = (
+            func, asyncio.iscoroutinefunction(func))
 
     @classmethod
     def add_socket_event(cls, func: typing.Callable) -> None:
@@ -306,7 +466,11 @@ class JsPyTextSocket(WebSocketEndpoint):
         ----------
         clear_socket_event()
         """
-        cls._socket_events.add(func)
+        if asyncio.iscoroutinefunction(func):
+            if func not in cls._async_events:
+                cls._async_events = cls._async_events + (func,)
+        elif func not in cls._sync_events:
+            cls._sync_events = cls._sync_events + (func,)
 
     @classmethod
     def clear_socket_event(cls) -> None:
@@ -316,7 +480,8 @@ class JsPyTextSocket(WebSocketEndpoint):
         ----------
         add_socket_event()
         """
-        cls._socket_events.clear()
+        cls._sync_events = ()
+        cls._async_events = ()
 
     @classmethod
     def reservecast(cls, data, socket: typing.Union[
@@ -335,12 +500,149 @@ class JsPyTextSocket(WebSocketEndpoint):
             Specifiable types:
                 int, float, str, None, True, False,
                 list, dict, tuple(convert to list)
+                float nan, inf(convert to null only if orjson is installed)
         socket: None or int or list or tuple or set, default None
             socket ID to send. If None, same as broadcast()
             The socket ID is a unique number that is assigned to the client
             by the server when websocket communication is established.
         """
-        JsPyBackground.register_function(cls.multicast, (data, socket))
+        JsPyBackground.register_function(
+            cls._outbox_data if cls._coalesce else cls.multicast,
+            (data, socket))
+
+    @classmethod
+    def reservecast_text(cls, text_data: str, socket: typing.Union[
+                         None, int, typing.List[int],
+                         typing.Tuple[int], typing.Set[int]]=None) -> None:
+        """Reserve to send already JSON encoded text to the specified sockets.
+
+        Same as reservecast(), but the data is encoded by the caller.
+        This can be used on other than the main thread.
+
+        Parameters
+        ----------
+        text_data: str
+            JSON format string.
+        socket: None or int or list or tuple or set, default None
+            socket ID to send. If None, send to all connected sockets.
+        """
+        JsPyBackground.register_function(
+            cls._outbox_text if cls._coalesce else cls.multicast_text,
+            (text_data, socket))
+
+    @classmethod
+    def set_coalesce(cls, enable: bool) -> None:
+        """Enable or disable coalescing of reservecast() in one frame.
+
+        When enabled, the data reserved by reservecast() and
+        reservecast_text() in the same turn of the event loop is sent to
+        each client together in one websocket frame (a JSON array of
+        data). Many small reservations use much fewer frames.
+        The order of the data is kept. broadcast() and multicast() are
+        not affected.
+
+        The client must use the version of 'JsPyTextSocket.js' that accepts
+        a JSON array of data.
+
+        Parameters
+        ----------
+        enable: bool
+            True: Coalesce. False(default): One frame per reservation.
+        """
+        cls._coalesce = bool(enable)
+
+    @classmethod
+    def flush_now(cls) -> None:
+        """Send the coalesced data immediately.
+
+        Call on the main thread where the event loop is running.
+        Normally the data is sent automatically in the next turn of
+        the event loop.
+        """
+        cls._outbox_flush()
+
+    @classmethod
+    def _outbox_data(cls, data, socket) -> None:
+        """Encode the data and store it until the next flush."""
+        cls._outbox_text(_encode(data), socket)
+
+    @classmethod
+    def _outbox_text(cls, text_data: str, socket) -> None:
+        """Store the encoded data until the next flush.
+
+        Called in the event loop thread.
+        """
+        outbox = cls._outbox
+        for ws_id in cls._target_socket_id(socket):
+            if ws_id in outbox:
+                outbox[ws_id].append(text_data)
+            else:
+                outbox[ws_id] = [text_data]
+        if outbox and not cls._outbox_scheduled:
+            cls._outbox_scheduled = True
+            asyncio.get_running_loop().call_soon(cls._outbox_flush)
+
+    @classmethod
+    def _outbox_flush(cls) -> None:
+        """Send the stored data. One frame per client if possible."""
+        outbox = cls._outbox
+        cls._outbox = {}
+        cls._outbox_scheduled = False
+        text_max = cls.OUTBOX_TEXT_MAX
+        for ws_id, texts in outbox.items():
+            if len(texts) == 1:
+                cls.multicast_text(texts[0], ws_id)
+                continue
+            # Split into frames not exceeding OUTBOX_TEXT_MAX.
+            frame = []
+            size = 0
+            for text_data in texts:
+                if frame and size + len(text_data) > text_max:
+                    cls.multicast_text('[' + ','.join(frame) + ']', ws_id)
+                    frame = []
+                    size = 0
+                frame.append(text_data)
+                size += len(text_data) + 1
+            cls.multicast_text('[' + ','.join(frame) + ']', ws_id)
+
+    @classmethod
+    def reservecast_many(cls, messages: typing.Iterable[typing.Tuple[
+                         typing.Any, typing.Union[
+                         None, int, typing.List[int],
+                         typing.Tuple[int], typing.Set[int]]]]) -> None:
+        """Reserve to send many data at once. Same as repeated reservecast().
+
+        Only one reservation is made for all the messages, and the same
+        data object is encoded only once even if it appears many times.
+        This can be used on other than the main thread.
+
+        Parameters
+        ----------
+        messages: Iterable of (data, socket)
+            data: Data that can be converted to JSON format.
+                  Data that cannot be converted is skipped.
+            socket: None or int or list or tuple or set
+                  socket ID to send. If None, send to all connected sockets.
+        """
+        JsPyBackground.register_function(cls._multicast_many,
+                                         (list(messages),))
+
+    @classmethod
+    def _multicast_many(cls, messages: list) -> typing.Awaitable:
+        """Send the messages reserved by reservecast_many()"""
+        # key: id() of data (kept alive by messages), value: JSON string
+        encoded = {}
+        cor_list = []
+        for data, socket in messages:
+            text_data = encoded.get(id(data))
+            if text_data is None:
+                try:
+                    text_data = _encode(data)
+                except TypeError:
+                    continue
+                encoded[id(data)] = text_data
+            cor_list.append(cls.multicast_text(text_data, socket))
+        return _gather(*cor_list, return_exceptions=True)
 
     @classmethod
     def broadcast(cls, data) -> typing.Awaitable:
@@ -361,6 +663,7 @@ class JsPyTextSocket(WebSocketEndpoint):
             Specifiable types:
                 int, float, str, None, True, False,
                 list, dict, tuple(convert to list)
+                float nan, inf(convert to null only if orjson is installed)
 
         Returns
         ----------
@@ -371,11 +674,7 @@ class JsPyTextSocket(WebSocketEndpoint):
         TypeError
             Argument data cannot be converted to JSON format.
         """
-        text_data = json.dumps(data)
-        cor_list = []
-        for socket_id in cls._socket_pool:
-            cor_list.append(cls._socket_pool[socket_id].send_text(text_data))
-        return asyncio.gather(*cor_list, return_exceptions=True)
+        return cls.multicast_text(_encode(data), None)
 
     @classmethod
     def multicast(cls, data, socket: typing.Union[
@@ -398,6 +697,7 @@ class JsPyTextSocket(WebSocketEndpoint):
             Specifiable types:
                 int, float, str, None, True, False,
                 list, dict, tuple(convert to list)
+                float nan, inf(convert to null only if orjson is installed)
         socket: None or int or list or tuple or set, default None
             socket ID to send. If None, same as broadcast_json()
             The socket ID is a unique number that is assigned to the client
@@ -412,19 +712,100 @@ class JsPyTextSocket(WebSocketEndpoint):
         TypeError
             Argument data cannot be converted to JSON format.
         """
-        cor_list = []
-        text_data = json.dumps(data)
+        return cls.multicast_text(_encode(data), socket)
+
+    @classmethod
+    def multicast_text(cls, text_data: str, socket: typing.Union[
+                       None, int, typing.List[int],
+                       typing.Tuple[int], typing.Set[int]]=None
+                      ) -> typing.Awaitable:
+        """Send already JSON encoded text to the specified sockets.
+
+        Same as multicast(), but the data is encoded by the caller.
+        When the same data is sent many times, encode it only once.
+
+        Parameters
+        ----------
+        text_data: str
+            JSON format string.
+        socket: None or int or list or tuple or set, default None
+            socket ID to send. If None, send to all connected sockets.
+
+        Returns
+        ----------
+        asyncio.gather instance with return_exceptions=True
+        """
+        return _gather(
+            *[ws.send_text(text_data) for ws in cls._target_sockets(socket)],
+            return_exceptions=True)
+
+    @classmethod
+    def multicast_bytes(cls, byte_data: bytes, socket: typing.Union[
+                        None, int, typing.List[int],
+                        typing.Tuple[int], typing.Set[int]]=None
+                       ) -> typing.Awaitable:
+        """Send a binary frame to the specified sockets.
+
+        Parameters
+        ----------
+        byte_data: bytes
+            Binary frame. (Refer to Notes of the class)
+        socket: None or int or list or tuple or set, default None
+            socket ID to send. If None, send to all connected sockets.
+
+        Returns
+        ----------
+        asyncio.gather instance with return_exceptions=True
+        """
+        return _gather(
+            *[ws.send_bytes(byte_data) for ws in cls._target_sockets(socket)],
+            return_exceptions=True)
+
+    @classmethod
+    def _target_sockets(cls, socket: typing.Union[
+                        None, int, typing.List[int],
+                        typing.Tuple[int], typing.Set[int]]
+                       ) -> typing.Iterable[WebSocket]:
+        """WebSocket instances of the specified sockets that are connected
+
+        Parameters
+        ----------
+        socket: None or int or list or tuple or set
+            socket ID. If None, all connected sockets.
+        """
+        pool = cls._socket_pool
+        if socket is None:
+            return pool.values()
+        elif isinstance(socket, int):
+            ws = pool.get(socket)
+            return (ws,) if ws is not None else ()
+        elif isinstance(socket, (tuple, list, set)):
+            # Bound dict.get, no temporary set. Not connected IDs are None.
+            return [ws for ws in map(pool.get, socket) if ws is not None]
+        else:
+            return ()
+
+    @classmethod
+    def _target_socket_id(cls, socket: typing.Union[
+                          None, int, typing.List[int],
+                          typing.Tuple[int], typing.Set[int]]
+                         ) -> typing.Iterable[int]:
+        """Socket ID of the specified sockets that are connected
+
+        Parameters
+        ----------
+        socket: None or int or list or tuple or set
+            socket ID. If None, all connected sockets.
+        """
+        pool = cls._socket_pool
         if socket is None:
-            return cls.broadcast(data)
+            return pool.keys()
         elif isinstance(socket, int):
-            if socket in cls._socket_pool:
-                cor_list.append(cls._socket_pool[socket].send_text(text_data))
+            return (socket,) if socket in pool else ()
         elif isinstance(socket, (tuple, list, set)):
-            for i in socket:
-                if i in cls._socket_pool:
-                    cor_list.append(
-                        cls._socket_pool[i].send_text(text_data))
-        return asyncio.gather(*cor_list, return_exceptions=True)
+            return [i for i in socket if i in pool]
+        else:
+            return ()
 
     @classmethod
     def _append_socket(cls, ws: WebSocket) -> int:
@@ -443,15 +824,18 @@ class JsPyTextSocket(WebSocketEndpoint):
             The assigned socket ID. Unique number assigned from 1.
             Increment by 1 in connection order.
         """
-        cls._socket_serial += 1
-        if cls._socket_serial > cls.SERIAL_MAX:
-            cls._socket_serial = 1
-        while cls._socket_serial in cls._socket_pool:
-            cls._socket_serial += 1
-            if cls._socket_serial > cls.SERIAL_MAX:
-                cls._socket_serial = 1
-        cls._socket_pool[cls._socket_serial] = ws
-        return(cls._socket_serial)
+        pool = cls._socket_pool
+        serial = cls._socket_serial + 1
+        if serial > cls.SERIAL_MAX:
+            serial = 1
+        # Only after the socket ID wraps around can it be in use.
+        while serial in pool:
+            serial += 1
+            if serial > cls.SERIAL_MAX:
+                serial = 1
+        cls._socket_serial = serial
+        pool[serial] = ws
+        return serial
 
     @classmethod
     def _delete_socket(cls, socket_id: int) -> None:
@@ -468,6 +852,24 @@ class JsPyTextSocket(WebSocketEndpoint):
         if socket_id in cls._socket_pool:
             del cls._socket_pool[socket_id]
 
+    @classmethod
+    def _call_socket_events(cls, socket_id: int, event: str) -> None:
+        """Call the callback functions registered by add_socket_event()
+
+        Normal functions are called immediately.
+        Async functions are executed later in the event loop.
+        """
+        for callback in cls._sync_events:
+            try:
+                callback(socket_id, event)
+            except Exception:
+                pass
+        for callback in cls._async_events:
+            try:
+                _create_task(callback(socket_id, event))
+            except Exception:
+                pass
+
     async def on_connect(self, ws: WebSocket):
         """Processing when websocket is newly established
 
@@ -491,54 +893,51 @@ class JsPyTextSocket(WebSocketEndpoint):
             {'protocol': 'system', 'key': 'connect', 'id': 0,
              'data': XXX, 'exception': None}
         """
-        JsPyTextSocket._connected += 1
+        cls = JsPyTextSocket
+        cls._connected += 1
         await ws.accept()
-        self._socket_id = JsPyTextSocket._append_socket(ws)
-        if JsPyTextSocket._connection_limit > 0 and\
-           JsPyTextSocket._connected > JsPyTextSocket._connection_limit:
-            send_dict = {'protocol': 'system', 'key': 'connect', 'id': 0,
-                         'data': None, 'exception':
-                         'Connection refused due to connection limit @python'}
-            await ws.send_json(send_dict)
+        self._socket_id = socket_id = cls._append_socket(ws)
+        limit = cls._connection_limit
+        if limit > 0 and cls._connected > limit:
+            await ws.send_text(cls._REFUSED_TEXT)
             await ws.close()
             # on_disconnect() is called immediately by ws.close().
         else:
-            send_dict = {'protocol': 'system', 'key': 'connect', 'id': 0,
-                         'data': self._socket_id, 'exception': None}
-            await ws.send_json(send_dict)
-        for callback in JsPyTextSocket._socket_events:
-            try:
-                if asyncio.iscoroutinefunction(callback):
-                    asyncio.create_task(callback(self._socket_id, 'connect'))
-                else:
-                    callback(self._socket_id, 'connect')
-            except:
-                pass
+            await ws.send_text(cls._ACCEPT_PREFIX + str(socket_id) +
+                               cls._ACCEPT_SUFFIX)
+        cls._call_socket_events(socket_id, 'connect')
 
     async def on_receive(self, ws: WebSocket, data: str):
         """Processing when data is received"""
+        cls = JsPyTextSocket
         try:
-            dict_data = json.loads(data)
-            if('protocol' in dict_data and 'key' in dict_data and
-               'id' in dict_data and 'data' in dict_data and
-               'exception' in dict_data):
-                call_func = JsPyTextSocket._protocol_table[dict_data['protocol']]
-                if(asyncio.iscoroutinefunction(call_func)):
-                    asyncio.create_task(call_func(ws, self._socket_id, dict_data))
-                else:
-                    call_func(ws, self._socket_id, dict_data)
-        except:
-            pass
+            dict_data = _decode(data)
+        except (ValueError, RecursionError):
+            # RecursionError: deeply nested JSON with the json module.
+            return
+        if not(isinstance(dict_data, dict) and
+               cls._REQUIRED_KEYS <= dict_data.keys()):
+            return
+        try:
+            entry = cls._protocol_table.get(dict_data['protocol'])
+        except TypeError:
+            # Unhashable protocol name
+            return
+        if entry is None:
+            return
+        call_func, is_coro = entry
+        if is_coro:
+            _create_task(call_func(ws, self._socket_id, dict_data))
+        else:
+            try:
+                call_func(ws, self._socket_id, dict_data)
+            except Exception:
+                pass
 
     async def on_disconnect(self, ws: WebSocket, close_code: int):
         """Processing when websocket is disconnected"""
-        JsPyTextSocket._delete_socket(self._socket_id)
-        JsPyTextSocket._connected -= 1
-        for callback in JsPyTextSocket._socket_events:
-            try:
-                if asyncio.iscoroutinefunction(callback):
-                    asyncio.create_task(callback(self._socket_id, 'disconnect'))
-                else:
-                    callback(self._socket_id, 'disconnect')
-            except:
-                pass
+        cls = JsPyTextSocket
+        socket_id = self._socket_id
+        cls._delete_socket(socket_id)
+        cls._connected -= 1
+        cls._call_socket_events(socket_id, 'disconnect')
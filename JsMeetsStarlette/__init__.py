@@ -5,7 +5,7 @@ from starlette.applications import Starlette
 from starlette.staticfiles import StaticFiles
 from starlette.templating import Jinja2Templates
 from starlette.endpoints import WebSocketEndpoint
-from .JsPyTextSocket import JsPyError, JsPyTextSocket
+from .JsPyTextSocket import JsPyError, JsPyTextSocket, jspy_json_default
 from . import JsPyBackground
 
 __copyright__ = 'Copyright (c) 2020 meloncookie'
@@ -70,6 +70,7 @@ JsPyTextSocket.reconnect = (url) => {
     }
     try{
         JsPyTextSocket._websocket = new WebSocket(url);
+        JsPyTextSocket._websocket.binaryType = 'arraybuffer';
     }
     catch(e){
         JsPyTextSocket._websocket = null;
@@ -78,15 +79,36 @@ JsPyTextSocket.reconnect = (url) => {
         return(false);
     }
     JsPyTextSocket._websocket.onmessage = (event) => {
+        let msg_list;
         try{
-            let msg_obj = JSON.parse(event.data);
-            if('protocol' in msg_obj && 'key' in msg_obj && 'id' in msg_obj &&
-                'data' in msg_obj && 'exception' in msg_obj && JsPyTextSocket._protocol_table.has(msg_obj['protocol'])){
-                JsPyTextSocket._protocol_table.get(msg_obj['protocol'])(msg_obj);
+            if(event.data instanceof ArrayBuffer){
+                // Binary frame: header length(4 bytes), header(JSON), data
+                let header_len = new DataView(event.data).getUint32(0);
+                msg_list = JSON.parse(new TextDecoder().decode(
+                    new Uint8Array(event.data, 4, header_len)));
+                msg_list['data'] = event.data.slice(4 + header_len);
+            }
+            else{
+                msg_list = JSON.parse(event.data);
             }
         }
         catch(e){
-            // Do nothing
+            return;
+        }
+        // The server may send several messages together in one array.
+        if(!Array.isArray(msg_list)){
+            msg_list = [msg_list];
+        }
+        for(let msg_obj of msg_list){
+            try{
+                if('protocol' in msg_obj && 'key' in msg_obj && 'id' in msg_obj &&
+                    'data' in msg_obj && 'exception' in msg_obj && JsPyTextSocket._protocol_table.has(msg_obj['protocol'])){
+                    JsPyTextSocket._protocol_table.get(msg_obj['protocol'])(msg_obj);
+                }
+            }
+            catch(e){
+                // Do nothing
+            }
         }
     };
     JsPyTextSocket._websocket.onclose = (event) => {
@@ -1,15 +1,22 @@
+import pathlib
 import setuptools
 
 SHORT_DISCRIPTION = 'This is a library that bridges '\
     'server-side python and browser-side javascript.'
-with open('README.md', encoding='utf-8') as f:
-    long_description = f.read()
+
+def _long_description() -> str:
+    """Contents of README.md next to this file. Empty if it is missing."""
+    try:
+        return (pathlib.Path(__file__).parent / 'README.md').read_text(
+            encoding='utf-8')
+    except FileNotFoundError:
+        return ''
 
 setuptools.setup(
     name='JsMeetsStarlette',
     version='0.0.0',
     description=SHORT_DISCRIPTION,
-    long_description=long_description,
+    long_description=_long_description(),
     long_description_content_type='text/markdown',
     author='meloncookie',
     author_email='',
@@ -22,6 +29,9 @@ setuptools.setup(
             "graphene",
             "itsdangerous",
             "jinja2",
+            # Used for JSON if installed. Same result as the standard
+            # json module, except float nan and inf are sent as null.
+            "orjson",
             "python-multipart",
             "pyyaml",
             "requests",
@@ -1,6 +1,4 @@
-import typing
-import asyncio
-import json
+import functools
 from starlette.websockets import WebSocket
 from JsMeetsStarlette import JsMeetsPy, JsPyBinarySocket
 from starlette.responses import PlainTextResponse
@@ -16,7 +14,9 @@ async def receiver(ws: WebSocket, socket_id: int, data: bytes) -> None:
     data: bytes
         Received data
     """
-    print('From socket ID {}, data: {}'.format(socket_id, str(data)))
+    # Removed at compile time by 'python -O'.
+    if __debug__:
+        print(f'From socket ID {socket_id}, {len(data)} bytes')
     # If you want to send the data back, use the send_bytes method.
     # await ws.send_bytes(b'OK')
 
@@ -30,7 +30,7 @@ def onsocket(id: int, reason: str) -> None:
     reason: str
         "connect" or "disconnect"
     """
-    print('Socket ID {} : {}'.format(id, reason))
+    print(f'Socket ID {id} : {reason}')
 
 # Access http://xxx/static/index_binary.html
 app = JsMeetsPy(debug=True, static='static',
@@ -44,18 +44,25 @@ bs.add_socket_event(onsocket)
 # Register websocket endpoint in the app instance.
 app.add_socket(bs)
 
+@functools.lru_cache(maxsize=64)
+def _encode_data(data: str) -> bytes:
+    """UTF-8 bytes of the broadcast data. Repeated data is encoded once."""
+    return data.encode()
+
 # HTTP
 @app.route('/broadcast', ['GET'])
 def page_broadcast(request):
-    if 'data' in request.query_params:
-        bs.reservecast(request.query_params['data'].encode(), None)
-    return PlainTextResponse('Broadcast: '+request.query_params['data'])
+    data = request.query_params.get('data')
+    if data is None:
+        return PlainTextResponse('data is required', 400)
+    bs.reservecast(_encode_data(data), None)
+    return PlainTextResponse('Broadcast: '+data)
 
 @app.route('/state', ['GET'])
 def page_state(request):
     ids = bs.get_socket_id()
     connect = bs.number_of_connections()
-    info = 'Now {} connections: {}'.format(connect, str(ids))
+    info = f'Now {connect} connections: {ids}'
     return PlainTextResponse(info)
 
 @app.route('/disconnect', ['GET'])
@@ -1,8 +1,32 @@
-import typing
+import os
 import asyncio
-import json
-from starlette.responses import PlainTextResponse
-from JsMeetsStarlette import JsMeetsPy, JsPyError, JsPyTextSocket, JsPyFunction
+# _jloads: Decoder of the query parameter 'args'.
+try:
+    import ujson as json
+    _jloads = json.loads
+except ImportError:
+    import json
+    _jloads = json.JSONDecoder().decode
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from starlette.responses import PlainTextResponse, Response
+from JsMeetsStarlette import (JsMeetsPy, JsPyTextSocket, JsPyFunction,
+                              jspy_json_default)
+# Bound once, used on every call from clients.
+from JsMeetsStarlette.JsPyFunction import (
+    call as _jpf_call, call_nowait as _jpf_call_nowait,
+    expose_many as _jpf_expose_many, clear as _jpf_clear,
+    is_running as _jpf_is_running, get_keys as _jpf_get_keys,
+    has as _jpf_has)
+_jst_number_of_connections = JsPyTextSocket.number_of_connections
+_jst_set_connection_limit = JsPyTextSocket.set_connection_limit
+
+# Sleep time of py_normal and py_exclusive [sec].
+# Set environment variable JSMEETSPY_DEMO_SLEEP=0 to measure
+# only the call overhead.
+_SLEEP = float(os.getenv('JSMEETSPY_DEMO_SLEEP', '10'))
 
 # Access http://xxx/static/index_function.html
 app = JsMeetsPy(debug=True, static='static',
@@ -12,7 +36,7 @@ app = JsMeetsPy(debug=True, static='static',
 async def py_normal(title: str):
     """Normal exposed function
 
-    Enter -> async sleep 10sec -> Exit
+    Enter -> async sleep 10sec(_SLEEP) -> Exit
     Respond to calls from other clients, even if the call is from one client.
 
     Parameters
@@ -25,7 +49,7 @@ async def py_normal(title: str):
     True
     """
     print(f'Enter py_normal: {title}')
-    await asyncio.sleep(10)
+    await asyncio.sleep(_SLEEP)
     print(f'Exit  py_normal: {title}')
     return True
 
@@ -33,7 +57,7 @@ async def py_normal(title: str):
 async def py_exclusive(title: str):
     """Exclusive exposed function
 
-    Enter -> async sleep 10sec -> Exit
+    Enter -> async sleep 10sec(_SLEEP) -> Exit
     During the call from one client,
     the call from another client is made to wait.
 
@@ -47,7 +71,7 @@ async def py_exclusive(title: str):
     True
     """
     print(f'Enter py_exclusive: {title}')
-    await asyncio.sleep(10)
+    await asyncio.sleep(_SLEEP)
     print(f'Exit  py_exclusive: {title}')
     return True
 
@@ -71,6 +95,60 @@ def positive_sum3(a: int, b: int, c: int=0):
     return a+b+c
 JsPyFunction.expose('py_sum', positive_sum3)
 
+def _set_connection_limit(key: str, args: list):
+    # Set socket quantity limit.
+    _jst_set_connection_limit(*args)
+    return True
+
+def _clear(key: str, args: list):
+    _jpf_clear('py_normal')
+    _jpf_clear('py_exclusive')
+    _jpf_clear('py_sum')
+    return True
+
+def _expose(key: str, args: list):
+    _jpf_expose_many([('py_normal', py_normal, False),
+                      ('py_exclusive', py_exclusive, True),
+                      ('py_sum', positive_sum3, False)])
+    return True
+
+def _is_running(key: str, args: list):
+    run1 = _jpf_is_running('py_normal')
+    run2 = _jpf_is_running('py_exclusive')
+    run3 = _jpf_is_running('py_sum')
+    return (f'py_normal: {run1}, py_exclusive: {run2}, '
+            f'py_sum: {run3}')
+
+def _call_nowait(key: str, args: list):
+    _jpf_call_nowait(key)(*args)
+    return True
+
+async def _call(key: str, args: list):
+    # timeout 25sec
+    # JsPyError in the result is encoded by the transport.
+    # (Refer to jspy_json_default())
+    return await _jpf_call(key, 25)(*args)
+
+# Functions called by reverse_call()
+# key:   function name
+# value: (whether it is an async function,
+#         function with two arguments (key, args))
+_reverse_functions = {
+    # Get a tuple of currently connected socket ID.
+    'get_socket_id': (False, lambda key, args: _socket_ids),
+    # Get the number of currently connected sockets.
+    'number_of_connections':
+        (False, lambda key, args: _jst_number_of_connections()),
+    'set_connection_limit': (False, _set_connection_limit),
+    'clear': (False, _clear),
+    'expose': (False, _expose),
+    'is_running': (False, _is_running),
+    'get_keys': (False, lambda key, args: _jpf_get_keys()),
+    'has': (False, lambda key, args: _jpf_has(*args)),
+    'call_nowait': (False, _call_nowait),
+    'call': (True, _call),
+}
+
 @JsPyFunction.callable
 async def reverse_call(name:str, key:str, args:list):
     """Call various server functions from the client side.
@@ -88,66 +166,49 @@ async def reverse_call(name:str, key:str, args:list):
     ----------
     Any
     """
-    if name == 'get_socket_id':
-        # Get a tuple of currently connected socket ID.
-        return JsPyTextSocket.get_socket_id()
-    elif name == 'number_of_connections':
-        # Get the number of currently connected sockets.
-        return JsPyTextSocket.number_of_connections()
-    elif name == 'set_connection_limit':
-        # Set socket quantity limit.
-        JsPyTextSocket.set_connection_limit(*args)
-        return True
-    elif name == 'clear':
-        JsPyFunction.clear('py_normal')
-        JsPyFunction.clear('py_exclusive')
-        JsPyFunction.clear('py_sum')
-        return True
-    elif name == 'expose':
-        JsPyFunction.expose('py_normal', py_normal)
-        JsPyFunction.expose('py_exclusive', py_exclusive, True)
-        JsPyFunction.expose('py_sum', positive_sum3)
-        return True
-    elif name == 'is_running':
-        run1 = JsPyFunction.is_running('py_normal')
-        run2 = JsPyFunction.is_running('py_exclusive')
-        run3 = JsPyFunction.is_running('py_sum')
-        return (f'py_normal: {run1}, py_exclusive: {run2}, '
-                f'py_sum: {run3}')
-    elif name == 'get_keys':
-        all_names = JsPyFunction.get_keys()
-        return all_names
-    elif name == 'has':
-        return JsPyFunction.has(*args)
-    elif name == 'call_nowait':
-        JsPyFunction.call_nowait(key)(*args)
-        return True
-    elif name == 'call':
-        # timeout 25sec
-        call_ack = await JsPyFunction.call(key, 25)(*args)
-        return json.dumps(call_ack, cls=JsPyError.JSONEncoder)
-    else:
+    entry = _reverse_functions.get(name)
+    if entry is None:
         return False
+    is_async, func = entry
+    if is_async:
+        return await func(key, args)
+    return func(key, args)
+
+# Tuple of currently connected socket ID.
+# Updated by print_socket_event() at every connection and disconnection.
+_socket_ids = ()
 
 def print_socket_event(id: int, event: str):
     """Print out socket open and close."""
+    global _socket_ids
+    _socket_ids = JsPyTextSocket.get_socket_id()
     print(f'Socket {id}: {event}')
 JsPyTextSocket.add_socket_event(print_socket_event)
 
 @app.route('/call_nowait', ['GET'])
 def page_call_nowait(request):
-    if 'key' in request.query_params and\
-       'args' in request.query_params:
-        key = request.query_params['key']
-        param = json.loads(request.query_params['args'])
-        JsPyFunction.call_nowait(key)(*param)
-        return PlainTextResponse('OK')
+    query = request.query_params
+    key = query.get('key')
+    args = query.get('args')
+    if key is None or args is None:
+        return PlainTextResponse('key and args are required', 400)
+    param = _jloads(args)
+    _jpf_call_nowait(key)(*param)
+    return PlainTextResponse('OK')
 
 @app.route('/call', ['GET'])
 async def page_call(request):
-    if 'key' in request.query_params and\
-       'args' in request.query_params:
-        key = request.query_params['key']
-        param = json.loads(request.query_params['args'])
-        ret = await JsPyFunction.call(key)(*param)
-        return PlainTextResponse(json.dumps(ret))
+    query = request.query_params
+    key = query.get('key')
+    args = query.get('args')
+    if key is None or args is None:
+        return PlainTextResponse('key and args are required', 400)
+    param = _jloads(args)
+    ret = await _jpf_call(key)(*param)
+    if orjson is not None:
+        # bytes as it is, without str -> UTF-8 conversion
+        # The keys of ret are int socket IDs.
+        return Response(orjson.dumps(ret, default=jspy_json_default,
+                                     option=orjson.OPT_NON_STR_KEYS),
+                        media_type='application/json')
+    return PlainTextResponse(json.dumps(ret))
@@ -1,9 +1,4 @@
-import typing
-import asyncio
-import json
-from starlette.responses import PlainTextResponse
-from JsMeetsStarlette import (JsMeetsPy, JsPyError, JsPyTextSocket,
-                              JsPyPubsub, JsPyFunction)
+from JsMeetsStarlette import JsMeetsPy, JsPyPubsub, JsPyFunction
 
 # Access http://xxx/static/index_pubsub.html
 app = JsMeetsPy(debug=True, static='static',
@@ -13,25 +8,38 @@ app = JsMeetsPy(debug=True, static='static',
 # a message will also be output to the server console.
 @JsPyPubsub.subscribe('hello')
 def topic_callback(topic, data):
-    print(topic+": "+str(data))
+    print(f'{topic}: {data}')
 
 # Test code ---------------------------------------
 def new_topic_callback(topic, data):
-    print(topic+">> "+str(data))
+    print(f'{topic}>> {data}')
+
+def _subscribe(args: list):
+    JsPyPubsub.subscribe('hello', new_topic_callback)
+    return True
+
+def _unsubscribe(args: list):
+    JsPyPubsub.unsubscribe('hello')
+    return True
+
+def _publish(args: list):
+    JsPyPubsub.publish(*args)({'name': 'server', 'message': 'hello'})
+    return True
+
+# Functions called by py_function()
+# key:   function name
+# value: function with one argument (args)
+_py_functions = {
+    'subscribe': _subscribe,
+    'unsubscribe': _unsubscribe,
+    'publish': _publish,
+    'get_topics': lambda args: JsPyPubsub.get_topics(),
+}
 
 @JsPyFunction.callable
 async def py_function(name:str, args:list):
-    if name == 'subscribe':
-        JsPyPubsub.subscribe('hello', new_topic_callback)
-        return True
-    elif name == 'unsubscribe':
-        JsPyPubsub.unsubscribe('hello')
-        return True
-    elif name == 'publish':
-        JsPyPubsub.publish(*args)({'name': 'server', 'message': 'hello'})
-        return True
-    elif name == 'get_topics':
-        return JsPyPubsub.get_topics()
-    else:
+    func = _py_functions.get(name)
+    if func is None:
         return False
+    return func(args)
 # -------------------------------------------------
@@ -1,8 +1,4 @@
-import typing
-import asyncio
-import json
 from JsMeetsStarlette import JsMeetsPy, JsPyQueue, JsPyFunction
-from starlette.responses import PlainTextResponse
 
 # Access http://xxx/static/index_queue.html
 app = JsMeetsPy(debug=True, static='static',
@@ -16,7 +12,7 @@ def print_screen(key: str):
     key: str
         Key name which is an independent queue space
     """
-    print('key: {} , data: {} has come.'.format(key, str(JsPyQueue.pop(key))))
+    print(f'key: {key} , data: {JsPyQueue.pop(key)} has come.')
 
 # Register the callback function when the queue data arrives.
 JsPyQueue.add_callback(print_screen)
@@ -24,59 +20,69 @@ JsPyQueue.add_callback(print_screen)
 # A method for a client to call an API on the server side.
 @JsPyFunction.callable
 async def push_nowait(key, value):
-    await JsPyQueue.push_nowait(key)(value)
+    JsPyQueue.push_nowait(key)(value)
     return True
 
 @JsPyFunction.callable
 async def push(key, value):
     return await JsPyQueue.push(key, timeout=3)(value)
 
-@JsPyFunction.callable
-async def pop(key):
-    return JsPyQueue.pop(key, '<<empty buffer>>')
-
-@JsPyFunction.callable
-async def shift(key):
-    return JsPyQueue.shift(key, '<<empty buffer>>')
-
-@JsPyFunction.callable
-async def add_callback():
+def _add_callback():
     JsPyQueue.add_callback(print_screen)
     return True
 
-@JsPyFunction.callable
-async def clear_callback():
+def _clear_callback():
     JsPyQueue.clear_callback()
     return True
 
-@JsPyFunction.callable
-async def is_empty(key):
-    return JsPyQueue.is_empty(key)
-
-@JsPyFunction.callable
-async def has(key):
-    return JsPyQueue.has(key)
-
-@JsPyFunction.callable
-async def get_keys():
-    return JsPyQueue.get_keys()
-
-@JsPyFunction.callable
-async def clear(key):
+def _clear(key):
     JsPyQueue.clear(key)
     return True
 
-@JsPyFunction.callable
-async def clear_all():
+def _clear_all():
     JsPyQueue.clear_all()
     return True
 
-@JsPyFunction.callable
-async def remove(key):
+def _remove(key):
     JsPyQueue.remove(key)
     return True
 
-@JsPyFunction.callable
-async def remove_all():
+def _remove_all():
     JsPyQueue.remove_all()
     return True
+
+# Queue operations called by q()
+# key:   operation name
+# value: function
+_queue_operations = {
+    'pop': lambda key: JsPyQueue.pop(key, '<<empty buffer>>'),
+    'shift': lambda key: JsPyQueue.shift(key, '<<empty buffer>>'),
+    'add_callback': _add_callback,
+    'clear_callback': _clear_callback,
+    'is_empty': JsPyQueue.is_empty,
+    'has': JsPyQueue.has,
+    'get_keys': JsPyQueue.get_keys,
+    'clear': _clear,
+    'clear_all': _clear_all,
+    'remove': _remove,
+    'remove_all': _remove_all,
+}
+
+@JsPyFunction.callable
+async def q(op, *args):
+    """Server queue operation called from clients.
+
+    Examples in client side
+    ----------
+    JsPyFunction.call("q")("pop", "some_key")
+    JsPyFunction.call("q")("get_keys")
+
+    Parameters
+    ----------
+    op: str
+        Operation name. pop, shift, add_callback, clear_callback,
+        is_empty, has, get_keys, clear, clear_all, remove, remove_all
+    args:
+        Parameters of the operation.
+    """
+    return _queue_operations[op](*args)